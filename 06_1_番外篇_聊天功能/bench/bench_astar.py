@@ -0,0 +1,164 @@
+"""
+AStar寻路性能测试：对比优化前（上一章节的线性扫描版）与当前版本每秒展开的节点数
+用法：python bench/bench_astar.py
+"""
+import importlib.util
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'jxzj'))
+
+import astar  # noqa: E402
+from engine import a_star  # noqa: E402
+from engine.common import Array2D  # noqa: E402
+from hpa import ClusterGraph  # noqa: E402
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# 上一章节的astar.py就是优化前的实现（openList线性扫描）
+OLD_ASTAR = os.path.join(os.path.dirname(ROOT), '05_5_网络编程_游戏客户端', 'jxzj', 'astar.py')
+
+
+class Grid:
+    def __init__(self, w, h, data):
+        self.w = w
+        self.h = h
+        self.data = data
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+
+def load_map(path, w, h):
+    with open(path) as file:
+        values = [int(line) for line in file if line.strip()]
+    return Grid(w, h, [values[x * h:(x + 1) * h] for x in range(w)])
+
+
+def random_map(w, h, rate, seed):
+    rnd = random.Random(seed)
+    return Grid(w, h, [[1 if rnd.random() < rate else 0 for _ in range(h)] for _ in range(w)])
+
+
+def block_map(w, h, count, seed):
+    """
+    随机放置矩形障碍物，比随机散点更接近游戏地图
+    """
+    rnd = random.Random(seed)
+    data = [[0] * h for _ in range(w)]
+    for _ in range(count):
+        bw, bh = rnd.randint(2, 12), rnd.randint(2, 12)
+        bx, by = rnd.randrange(w - bw), rnd.randrange(h - bh)
+        for x in range(bx, bx + bw):
+            for y in range(by, by + bh):
+                data[x][y] = 1
+    return Grid(w, h, data)
+
+
+def to_array2d(grid):
+    """
+    转换成游戏中使用的Array2D（每格1字节）
+    """
+    map2d = Array2D(grid.w, grid.h)
+    for x in range(grid.w):
+        map2d[x][:] = bytes(grid[x])
+    return map2d
+
+
+def random_pairs(grid, count, seed):
+    rnd = random.Random(seed)
+    cells = [(x, y) for x in range(grid.w) for y in range(grid.h) if grid[x][y] == 0]
+    return [(rnd.choice(cells), rnd.choice(cells)) for _ in range(count)]
+
+
+def run(cls, grid, pairs, method='start'):
+    expanded = 0
+    found = 0
+    begin = time.perf_counter()
+    for start, end in pairs:
+        finder = cls(grid, start, end)
+        if getattr(finder, method)():
+            found += 1
+        expanded += len(finder.closeSet) if hasattr(finder, 'closeSet') else len(finder.closeList)
+    cost = time.perf_counter() - begin
+    return expanded, found, cost
+
+
+def report(title, grid, pairs, implements):
+    print(title)
+    for name, cls in implements:
+        expanded, found, cost = run(cls, grid, pairs)
+        print('  %-6s 找到路径%4d条  展开节点%8d  耗时%8.3fs  %10.0f节点/秒' % (
+            name, found, expanded, cost, expanded / cost if cost else 0))
+
+
+def report_jps(title, grid, pairs):
+    print(title)
+    # 与游戏中一样使用Array2D，jumpPointSearch()会用正则表达式扫描行、列
+    grid = to_array2d(grid)
+    for method in ('start', 'jumpPointSearch'):
+        expanded, found, cost = run(a_star.AStar, grid, pairs, method)
+        print('  %-16s 找到路径%4d条  平均展开节点%8.1f  平均耗时%7.3fms' % (
+            method, found, expanded / len(pairs), cost / len(pairs) * 1000))
+
+
+def report_hpa(title, grid, pairs):
+    print(title)
+    begin = time.perf_counter()
+    graph = ClusterGraph(grid)
+    print('  构建抽象图耗时 %.3fs（簇在寻路第一次用到时才构建）' % (time.perf_counter() - begin))
+    # HPA*跑两遍：第一遍包括用到的簇的构建时间，第二遍簇都已经构建好了
+    for name, find in (('AStar', lambda s, e: astar.AStar(grid, s, e).start()), ('HPA*首次', graph.find_path),
+                       ('HPA*', graph.find_path)):
+        begin = time.perf_counter()
+        found = sum(1 for start, end in pairs if find(start, end))
+        cost = time.perf_counter() - begin
+        print('  %-6s 找到路径%4d条  平均耗时%8.3fms' % (name, found, cost / len(pairs) * 1000))
+
+
+def check_components(title, grid, pairs):
+    """
+    传入ConnectedComponents后结果要和不传时一样，包括起点是障碍（比如出生点）的情况
+    """
+    print(title)
+    grid = to_array2d(grid)
+    components = a_star.ConnectedComponents(grid)
+    walled = [(x, y) for x in range(grid.w) for y in range(grid.h) if grid[x][y] != 0]
+    ends = [end for _, end in pairs]
+    pairs = pairs + [(start, end) for start, end in zip(walled, ends)]
+    for start, end in pairs:
+        expect = a_star.AStar(grid, start, end).start()
+        result = a_star.AStar(grid, start, end, components=components).start()
+        assert (expect is None) == (result is None), '%s -> %s 结果不一致' % (start, end)
+    print('  %d次寻路（其中%d次起点是障碍）结果一致' % (len(pairs), len(pairs) - len(ends)))
+
+
+if __name__ == '__main__':
+    implements = [('new', astar.AStar)]
+    if os.path.exists(OLD_ASTAR):
+        implements.insert(0, ('old', load_module('old_astar', OLD_ASTAR).AStar))
+
+    game_map = load_map(os.path.join(ROOT, 'jxzj', 'img', 'map', '0.map'), 40, 22)
+    report('0.map (40x22)，随机200次寻路', game_map, random_pairs(game_map, 200, 1), implements)
+
+    big_map = random_map(150, 150, 0.2, 2)
+    report('随机地图 (150x150，20%障碍)，随机20次寻路', big_map, random_pairs(big_map, 20, 3), implements)
+
+    check_components('engine.a_star 连通分量 0.map，传入components与不传的结果对比', game_map,
+                     [((5, 5), (20, 20))] + random_pairs(game_map, 200, 1))
+    report_jps('engine.a_star 八方向 0.map，start() 与 jumpPointSearch()', game_map, random_pairs(game_map, 200, 1))
+    open_map = block_map(150, 150, 60, 4)
+    report_jps('engine.a_star 八方向 随机矩形障碍地图 (150x150)，start() 与 jumpPointSearch()', open_map,
+               random_pairs(open_map, 20, 5))
+
+    large_map = block_map(400, 400, 900, 6)
+    report_hpa('分层寻路 随机矩形障碍地图 (400x400)，随机20次寻路', large_map, random_pairs(large_map, 20, 7))
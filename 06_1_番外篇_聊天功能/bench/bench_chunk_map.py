@@ -0,0 +1,119 @@
+"""
+分块地图测试：生成一张分块的大地图，统计打开地图、镜头滚动时每帧更新和绘制的耗时，以及缓存的块数
+    1.打开地图：ChunkedGameMap只映射walk.bmap，不计算连通分量；对比GameMap.load_walk_file读取整张地图
+    2.镜头停住时，后台加载完成的块由update()返回窗口上的区域，只重绘这些区域
+    3.镜头沿对角线滚动穿过整张地图，缓存的块数不超过capacity
+用法：python bench/bench_chunk_map.py [宽(像素)] [高(像素)] [块大小]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'jxzj'))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from bench_map_load import block_map  # noqa: E402
+from core import ChunkedGameMap  # noqa: E402
+from engine.chunk import WALK_FILE, WORLD_FILE  # noqa: E402
+from engine.map_file import save_walk_map  # noqa: E402
+from walk_map import WalkMap  # noqa: E402
+
+WIN_WIDTH = 800
+WIN_HEIGHT = 571
+
+
+def make_world(path, width, height, chunk_size):
+    """
+    直接生成切分好的分块地图（下层每块一种颜色，上层只有少数块不透明）
+    """
+    os.makedirs(os.path.join(path, 'bottom'))
+    os.makedirs(os.path.join(path, 'top'))
+    chunk = pygame.Surface((chunk_size, chunk_size))
+    top = pygame.Surface((chunk_size, chunk_size), pygame.SRCALPHA)
+    top.fill((0, 128, 0, 255), (0, 0, chunk_size // 4, chunk_size // 4))
+    for cx in range((width + chunk_size - 1) // chunk_size):
+        for cy in range((height + chunk_size - 1) // chunk_size):
+            chunk.fill(((cx * 37) % 256, (cy * 59) % 256, 96))
+            pygame.image.save(chunk, os.path.join(path, 'bottom', '%d_%d.png' % (cx, cy)))
+            if (cx + cy) % 5 == 0:
+                pygame.image.save(top, os.path.join(path, 'top', '%d_%d.png' % (cx, cy)))
+    w, h = int(width / 32) + 1, int(height / 32) + 1
+    walk = block_map(w, h, 1)
+    # 镜头经过的对角线和寻路的起点终点保持可走
+    for i in range(max(w, h)):
+        walk[min(i, w - 1)][min(i * h // w, h - 1)] = 0
+    save_walk_map(os.path.join(path, WALK_FILE), walk)
+    with open(os.path.join(path, WORLD_FILE), 'w') as file:
+        json.dump({'width': width, 'height': height, 'chunk_size': chunk_size}, file)
+    return w, h
+
+
+def frame(screen, game_map, role_x, role_y):
+    game_map.roll(role_x, role_y, WIN_WIDTH, WIN_HEIGHT)
+    rects = game_map.update(screen)
+    game_map.draw_bottom(screen)
+    game_map.draw_top(screen)
+    return rects
+
+
+def main(width, height, chunk_size):
+    pygame.init()
+    screen = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+    with tempfile.TemporaryDirectory() as path:
+        begin = time.perf_counter()
+        w, h = make_world(path, width, height, chunk_size)
+        chunks = len(os.listdir(os.path.join(path, 'bottom')))
+        total = chunks + len(os.listdir(os.path.join(path, 'top')))
+        print('分块地图 %dx%d像素（%dx%d格），%d块 %dx%d，生成耗时%.1fs' % (
+            width, height, w, h, chunks, chunk_size, chunk_size, time.perf_counter() - begin))
+
+        begin = time.perf_counter()
+        whole = WalkMap(w, h)
+        whole.load_walk_file(os.path.join(path, WALK_FILE))
+        print('  WalkMap.load_walk_file（整张地图计算连通分量） %8.1fms' % ((time.perf_counter() - begin) * 1000))
+        begin = time.perf_counter()
+        game_map = ChunkedGameMap(path, 0, 0, capacity=64)
+        print('  ChunkedGameMap()                               %8.1fms' % ((time.perf_counter() - begin) * 1000))
+
+        # 镜头停在起点，等视野内的块加载完，统计update()返回的重绘区域
+        visible = {('bottom', cx, cy) for cx, cy in game_map.visible_chunks(screen)}
+        begin = time.perf_counter()
+        dirty = []
+        while not visible <= game_map.loader.cache.keys():
+            dirty += frame(screen, game_map, 0, 0)
+            time.sleep(0.001)
+        covered = pygame.Rect(dirty[0]).unionall(dirty[1:]) if dirty else pygame.Rect(0, 0, 0, 0)
+        print('  视野内的块全部加载 %8.1fms，update()返回%d个重绘区域，合起来覆盖%s（窗口%dx%d）' % (
+            (time.perf_counter() - begin) * 1000, len(dirty), tuple(covered), WIN_WIDTH, WIN_HEIGHT))
+
+        # 镜头沿对角线滚动穿过整张地图
+        steps = 2000
+        most = 0
+        cost = 0
+        for i in range(steps + 1):
+            begin = time.perf_counter()
+            frame(screen, game_map, width * i / steps, height * i / steps)
+            cost += time.perf_counter() - begin
+            most = max(most, len(game_map.loader.cache))
+        print('  镜头滚动%d帧，平均每帧%.2fms，最多缓存%d块（capacity=%d，共%d个图片文件）' % (
+            steps, cost / (steps + 1) * 1000, most, game_map.loader.capacity, total))
+
+        begin = time.perf_counter()
+        route = game_map.find_path((0, 0), (w - 1, h - 1))
+        print('  对角线寻路 %8.1fms，%s步，构建了%d/%d个簇' % (
+            (time.perf_counter() - begin) * 1000, len(route) if route else '走不通',
+            len(game_map.hpa.intra), game_map.hpa.cw * game_map.hpa.ch))
+
+
+if __name__ == '__main__':
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 12800
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 9600
+    chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+    main(width, height, chunk_size)
@@ -0,0 +1,81 @@
+"""
+地图加载测试：统计打开一张大地图的完整耗时（客户端GameMap和服务端都走WalkMap.load_walk_file）
+    分别统计读取数据、计算连通分量、创建分层寻路抽象图三步，以及加载后第一次跨图寻路（要构建沿途的簇）和再次寻路的耗时
+用法：python bench/bench_map_load.py [宽] [高]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'jxzj'))
+
+from engine.a_star import ConnectedComponents  # noqa: E402
+from engine.common import Array2D  # noqa: E402
+from engine.map_file import save_walk_map  # noqa: E402
+from hpa import ClusterGraph  # noqa: E402
+from walk_map import WalkMap  # noqa: E402
+
+
+def block_map(w, h, seed):
+    """
+    随机放置矩形障碍物，障碍物数量与面积成正比
+    """
+    rnd = random.Random(seed)
+    map2d = Array2D(w, h)
+    for _ in range(w * h // 180):
+        bw, bh = rnd.randint(2, 12), rnd.randint(2, 12)
+        bx, by = rnd.randrange(w - bw), rnd.randrange(h - bh)
+        for x in range(bx, bx + bw):
+            map2d.view[x * h + by:x * h + by + bh] = b'\x01' * bh
+    return map2d
+
+
+def report(title, path, w, h):
+    print(title)
+    walk_map = WalkMap(w, h)
+    begin = time.perf_counter()
+    walk_map.load_walk_file(path)
+    total = time.perf_counter() - begin
+
+    # 分步再做一遍，看时间花在哪里
+    steps = WalkMap(w, h)
+    begin = time.perf_counter()
+    if path.endswith('.bmap'):
+        steps.attach(walk_map.view.tobytes())
+    else:
+        with open(path, 'rb') as file:
+            steps.load_text(file.read())
+    read = time.perf_counter() - begin
+    begin = time.perf_counter()
+    ConnectedComponents(steps, diagonal=False)
+    components = time.perf_counter() - begin
+    begin = time.perf_counter()
+    ClusterGraph(steps)
+    hpa = time.perf_counter() - begin
+    print('  load_walk_file %8.1fms（读取数据%.1fms  连通分量%.1fms  抽象图%.1fms）' % (
+        total * 1000, read * 1000, components * 1000, hpa * 1000))
+
+    cells = [(x, y) for x in range(0, w, 7) for y in range(0, h, 7) if walk_map.walkable(x, y)]
+    start, end = random.Random(1).sample(cells, 2)
+    for title in ('加载后第一次寻路', '同样的寻路再来一次'):
+        begin = time.perf_counter()
+        walk_map.find_path(start, end)
+        print('  %s %8.1fms（%s -> %s，已构建%d个簇）' % (
+            title, (time.perf_counter() - begin) * 1000, start, end, len(walk_map.hpa.intra)))
+
+
+if __name__ == '__main__':
+    w = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    h = int(sys.argv[2]) if len(sys.argv) > 2 else 1500
+    map2d = block_map(w, h, 1)
+    with tempfile.TemporaryDirectory() as folder:
+        text_path = os.path.join(folder, 'walk.map')
+        with open(text_path, 'wb') as file:
+            file.write(b'\n'.join(bytes([48 + v]) for v in map2d.view))
+        binary_path = os.path.join(folder, 'walk.bmap')
+        save_walk_map(binary_path, map2d)
+        report('文本地图 .map (%dx%d)' % (w, h), text_path, w, h)
+        report('二进制地图 .bmap (%dx%d)' % (w, h), binary_path, w, h)
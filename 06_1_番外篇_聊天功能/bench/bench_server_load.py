@@ -0,0 +1,148 @@
+"""
+服务端压力测试：保持大量空闲连接，同时测量几个在线玩家的聊天往返延迟
+    服务端在子进程中运行（两边各占一半文件描述符），需要先调大ulimit -n
+用法：python bench/bench_server_load.py [空闲连接数] [聊天玩家数] [聊天次数]
+"""
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'jxzj'))
+
+from engine.codec import FrameDecoder, frame  # noqa: E402
+from engine.protocol import BINARY, JSON, decode, encode  # noqa: E402
+
+SERVER_DIR = os.path.join(ROOT, 'server')
+ADDRESS = ('127.0.0.1', 6677)
+
+SERVER_CODE = 'import main; main.Server(%r, %d)' % ADDRESS
+
+
+def start_server():
+    server = subprocess.Popen([sys.executable, '-c', SERVER_CODE], cwd=SERVER_DIR, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(ADDRESS).close()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError('服务端启动失败')
+
+
+class TestClient:
+    """
+    测试用的客户端
+    """
+
+    def __init__(self, codec=BINARY):
+        self.socket = socket.create_connection(ADDRESS)
+        self.codec = codec  # 登录时请求的编码
+        self.decoder = FrameDecoder(delimiter=False)
+        self.pending = []  # 已经收到但还没处理的协议
+
+    def send(self, py_obj):
+        self.socket.sendall(frame(encode(py_obj, self.codec)))
+
+    def recv(self):
+        data = self.socket.recv(65536)
+        if not data:
+            raise ConnectionError('连接被服务端关闭')
+        self.decoder.feed(data)
+        self.pending += [decode(pck) for pck in self.decoder]
+
+    def recv_until(self, protocol_name):
+        """
+        一直接收，直到收到指定的协议
+        """
+        while True:
+            while self.pending:
+                protocol = self.pending.pop(0)
+                if protocol['protocol'] == protocol_name:
+                    return protocol
+            self.recv()
+
+    def clear(self):
+        """
+        清掉已经收到的所有协议
+        """
+        self.socket.setblocking(False)
+        try:
+            while True:
+                self.recv()
+        except BlockingIOError:
+            pass
+        self.socket.setblocking(True)
+        self.pending.clear()
+
+    def login(self, index):
+        codec, self.codec = self.codec, JSON
+        self.send({'protocol': 'cli_login', 'username': 'admin0%d' % (index % 3 + 1), 'password': '123456',
+                   'codec': codec})
+        result = self.recv_until('ser_login')
+        self.codec = result.get('codec', JSON)
+        return result
+
+
+def main(idle_count=10000, chatters=5, rounds=200):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if idle_count + chatters + 100 > hard:
+        print('文件描述符上限为%d，空闲连接数调整为%d' % (hard, hard - chatters - 100))
+        idle_count = hard - chatters - 100
+
+    server = start_server()
+    idle = []
+    try:
+        begin = time.perf_counter()
+        for _ in range(idle_count):
+            idle.append(socket.create_connection(ADDRESS))
+        print('建立%d个空闲连接耗时 %.2fs' % (idle_count, time.perf_counter() - begin))
+
+        players = [TestClient() for _ in range(chatters)]
+        for i, player in enumerate(players):
+            player.login(i)
+        # 清掉登录时收到的上线消息
+        time.sleep(0.2)
+        for player in players:
+            player.clear()
+
+        latency = []
+        for i in range(rounds):
+            player = players[i % chatters]
+            begin = time.perf_counter()
+            player.send({'protocol': 'cli_chat', 'text': 'ping %d' % i})
+            # 自己收到ser_chat时，说明服务端已经处理并广播完
+            player.recv_until('ser_chat')
+            latency.append(time.perf_counter() - begin)
+            for other in players:
+                if other is not player:
+                    other.recv_until('ser_chat')
+
+        latency.sort()
+        print('%d个空闲连接 + %d个在线玩家，聊天%d次' % (idle_count, chatters, rounds))
+        print('  往返延迟 平均%.3fms  p50 %.3fms  p99 %.3fms  最大%.3fms' % (
+            sum(latency) / len(latency) * 1000, latency[len(latency) // 2] * 1000,
+            latency[int(len(latency) * 0.99)] * 1000, latency[-1] * 1000))
+        print('  服务端进程内存 %.1fMB' % (server_rss(server.pid) / 1024))
+    finally:
+        for sock in idle:
+            sock.close()
+        server.kill()
+        server.wait()
+
+
+def server_rss(pid):
+    with open('/proc/%d/status' % pid) as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+if __name__ == '__main__':
+    main(*[int(v) for v in sys.argv[1:]])
@@ -0,0 +1,114 @@
+"""
+服务端发送合并测试：统计服务端send/sendmsg系统调用次数和客户端收到的TCP数据段数
+    对比每次write立即发送（DEFER_FLUSH=False）、每轮事件循环合并发送（flush_interval=0）、每5毫秒合并发送（默认）
+用法：python bench/bench_syscalls.py [玩家数] [每人每秒聊天次数] [测试秒数]
+"""
+import json
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_server_load import ADDRESS, SERVER_DIR, TestClient  # noqa: E402
+
+# 在服务端进程中替换socket类，统计系统调用次数，收到SIGTERM时输出
+SERVER_CODE = '''
+import json, os, signal, socket, sys
+counts = {'send': 0, 'bytes': 0}
+
+class CountingSocket(socket.socket):
+    def send(self, data, *args):
+        counts['send'] += 1
+        sent = super().send(data, *args)
+        counts['bytes'] += sent
+        return sent
+
+    def sendmsg(self, buffers, *args):
+        counts['send'] += 1
+        sent = super().sendmsg(buffers, *args)
+        counts['bytes'] += sent
+        return sent
+
+def report(*args):
+    sys.stdout.write(json.dumps(counts) + '\\n')
+    sys.stdout.flush()
+    os._exit(0)
+
+socket.socket = CountingSocket
+signal.signal(signal.SIGTERM, report)
+import main
+main.Connection.DEFER_FLUSH = %r
+main.Server(%r, %d, flush_interval=%r)
+'''
+
+
+def run(defer, flush_interval, players, rate, seconds):
+    server = subprocess.Popen([sys.executable, '-c', SERVER_CODE % ((defer,) + ADDRESS + (flush_interval,))],
+                              cwd=SERVER_DIR, stdout=subprocess.PIPE, text=True)
+    for _ in range(100):
+        try:
+            client = TestClient()
+            break
+        except OSError:
+            time.sleep(0.05)
+    client.socket.close()
+
+    clients = [TestClient() for _ in range(players)]
+    for i, client in enumerate(clients):
+        client.login(i)
+    time.sleep(0.3)
+    for client in clients:
+        client.clear()
+
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        client.socket.setblocking(False)
+        selector.register(client.socket, selectors.EVENT_READ, client)
+
+    segments = 0
+    received = 0
+    interval = 1 / (rate * players)
+    steps = [(5, 4), (5, 3)]
+    begin = time.perf_counter()
+    next_send = begin
+    count = 0
+    while time.perf_counter() - begin < seconds:
+        now = time.perf_counter()
+        while now >= next_send:
+            # 轮流让每个玩家聊天，并来回走动
+            client = clients[count % players]
+            client.send({'protocol': 'cli_chat', 'text': 'hello %d' % count})
+            client.send({'protocol': 'cli_move', 'x': steps[count // players % 2][0],
+                         'y': steps[count // players % 2][1]})
+            count += 1
+            next_send += interval
+        for key, _ in selector.select(max(0, next_send - time.perf_counter())):
+            try:
+                key.data.recv()
+            except BlockingIOError:
+                continue
+            segments += 1
+            received += len(key.data.pending)
+            key.data.pending.clear()
+
+    server.send_signal(signal.SIGTERM)
+    counts = json.loads(server.communicate()[0].strip().splitlines()[-1])
+    for client in clients:
+        client.socket.close()
+    return counts, segments, received
+
+
+if __name__ == '__main__':
+    players, rate, seconds = [int(v) for v in sys.argv[1:]] or (50, 10, 5)
+    print('%d个玩家在同一视野内，每人每秒聊天%d次并走动，测试%d秒' % (players, rate, seconds))
+    for title, defer, flush_interval in (('每个包立即发送', False, 0), ('每轮事件循环合并', True, 0),
+                                         ('每5毫秒合并', True, 0.005)):
+        counts, segments, received = run(defer, flush_interval, players, rate, seconds)
+        print('  %s\t服务端发送系统调用 %7d次/秒  客户端recv %7d次/秒  收到协议包 %7d个/秒  平均每次发送%6.0f字节' % (
+            title, counts['send'] / seconds, segments / seconds, received / seconds,
+            counts['bytes'] / max(counts['send'], 1)))
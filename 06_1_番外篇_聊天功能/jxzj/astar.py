@@ -1,3 +1,6 @@
+import heapq
+
+
 class Point:
     """
     表示一个点
@@ -12,6 +15,9 @@ class Point:
             return True
         return False
 
+    def __hash__(self):
+        return hash((self.x, self.y))
+
     def __str__(self):
         return "x:" + str(self.x) + ",y:" + str(self.y)
 
@@ -19,6 +25,9 @@ class Point:
 class AStar:
     """
     AStar算法的Python3.x实现
+        1.开启表使用二叉堆（heapq），取F值最小的节点是O(logn)
+        2.开启表、关闭表都额外用以(x,y)为键的dict/set做索引，判断一个点在不在表中是O(1)
+        3.堆中的节点F值变小时不删除旧记录，而是重新入堆，旧记录出堆时直接跳过（惰性删除）
     """
 
     class Node:  # 描述AStar算法中的节点数据
@@ -27,6 +36,7 @@ class AStar:
             self.father = None  # 父节点
             self.g = g  # g值，g值在用到的时候会重新算
             self.h = (abs(endPoint.x - point.x) + abs(endPoint.y - point.y)) * 10  # 计算h值
+            self.seq = 0  # 进入开启表的顺序，F值相同时先进入的先出来
 
     def __init__(self, map2d, startPoint, endPoint, passTag=0):
         """
@@ -36,10 +46,14 @@ class AStar:
         :param endPoint: Point或二元组类型的寻路终点
         :param passTag: int类型的可行走标记（若地图数据!=passTag即为障碍）
         """
-        # 开启表
+        # 开启表（二叉堆，元素为(F值, 入表顺序, 节点)）
         self.openList = []
-        # 关闭表
-        self.closeList = []
+        # 开启表索引 (x,y)->节点
+        self.openDict = {}
+        # 关闭表 {(x,y)}
+        self.closeSet = set()
+        # 入表计数器
+        self.seq = 0
         # 寻路地图
         self.map2d = map2d
         # 起点终点
@@ -53,34 +67,39 @@ class AStar:
         # 可行走标记
         self.passTag = passTag
 
+    def pushNode(self, node):
+        """
+        把节点放入开启表
+        """
+        if node.seq == 0:
+            self.seq += 1
+            node.seq = self.seq
+            self.openDict[(node.point.x, node.point.y)] = node
+        heapq.heappush(self.openList, (node.g + node.h, node.seq, node))
+
     def getMinNode(self):
         """
-        获得openlist中F值最小的节点
-        :return: Node
+        获得openlist中F值最小的节点，并把它从openlist中删除
+        :return: Node或None（开启表为空）
         """
-        currentNode = self.openList[0]
-        for node in self.openList:
-            if node.g + node.h < currentNode.g + currentNode.h:
-                currentNode = node
-        return currentNode
+        while self.openList:
+            f, _, node = heapq.heappop(self.openList)
+            key = (node.point.x, node.point.y)
+            # 已经在关闭表中，或者是g值更新前留下的旧记录，跳过
+            if key in self.closeSet or f != node.g + node.h:
+                continue
+            del self.openDict[key]
+            return node
+        return None
 
     def pointInCloseList(self, point):
-        for node in self.closeList:
-            if node.point == point:
-                return True
-        return False
+        return (point.x, point.y) in self.closeSet
 
     def pointInOpenList(self, point):
-        for node in self.openList:
-            if node.point == point:
-                return node
-        return None
+        return self.openDict.get((point.x, point.y))
 
     def endPointInCloseList(self):
-        for node in self.openList:
-            if node.point == self.endPoint:
-                return node
-        return None
+        return self.openDict.get((self.endPoint.x, self.endPoint.y))
 
     def searchNear(self, minF, offsetX, offsetY):
         """
@@ -90,15 +109,16 @@ class AStar:
         :param offsetY:
         :return:
         """
+        x = minF.point.x + offsetX
+        y = minF.point.y + offsetY
         # 越界检测
-        if minF.point.x + offsetX < 0 or minF.point.x + offsetX > self.map2d.w - 1 or minF.point.y + offsetY < 0 or minF.point.y + offsetY > self.map2d.h - 1:
+        if x < 0 or x > self.map2d.w - 1 or y < 0 or y > self.map2d.h - 1:
             return
         # 如果是障碍，就忽略
-        if self.map2d[minF.point.x + offsetX][minF.point.y + offsetY] != self.passTag:
+        if self.map2d[x][y] != self.passTag:
             return
         # 如果在关闭表中，就忽略
-        currentPoint = Point(minF.point.x + offsetX, minF.point.y + offsetY)
-        if self.pointInCloseList(currentPoint):
+        if (x, y) in self.closeSet:
             return
         # 设置单位花费
         if offsetX == 0 or offsetY == 0:
@@ -106,16 +126,17 @@ class AStar:
         else:
             step = 14
         # 如果不再openList中，就把它加入openlist
-        currentNode = self.pointInOpenList(currentPoint)
+        currentNode = self.openDict.get((x, y))
         if not currentNode:
-            currentNode = AStar.Node(currentPoint, self.endPoint, g=minF.g + step)
+            currentNode = AStar.Node(Point(x, y), self.endPoint, g=minF.g + step)
             currentNode.father = minF
-            self.openList.append(currentNode)
+            self.pushNode(currentNode)
             return
         # 如果在openList中，判断minF到当前点的G是否更小
-        if minF.g + step < currentNode.g:  # 如果更小，就重新计算g值，并且改变father
+        if minF.g + step < currentNode.g:  # 如果更小，就重新计算g值，并且改变father，然后重新入堆
             currentNode.g = minF.g + step
             currentNode.father = minF
+            self.pushNode(currentNode)
 
     def start(self):
         """
@@ -125,22 +146,27 @@ class AStar:
         # 判断寻路终点是否是障碍
         if self.map2d[self.endPoint.x][self.endPoint.y] != self.passTag:
             return None
+        # 起点就是终点，不需要走
+        if self.startPoint == self.endPoint:
+            return None
 
         # 1.将起点放入开启列表
         startNode = AStar.Node(self.startPoint, self.endPoint)
-        self.openList.append(startNode)
+        self.pushNode(startNode)
         # 2.主循环逻辑
         while True:
-            # 找到F值最小的点
+            # 找到F值最小的点，并且在openList中删除它
             minF = self.getMinNode()
-            # 把这个点加入closeList中，并且在openList中删除它
-            self.closeList.append(minF)
-            self.openList.remove(minF)
+            if minF is None:
+                return None
+            # 把这个点加入closeList中
+            self.closeSet.add((minF.point.x, minF.point.y))
             # 判断这个节点的上下左右节点
             self.searchNear(minF, 0, -1)
             self.searchNear(minF, 0, 1)
             self.searchNear(minF, -1, 0)
             self.searchNear(minF, 1, 0)
+
             # 判断是否终止
             point = self.endPointInCloseList()
             if point:  # 如果终点在关闭表中，就返回结果
@@ -152,9 +178,4 @@ class AStar:
                         pathList.append(cPoint.point)
                         cPoint = cPoint.father
                     else:
-                        # print(pathList)
-                        # print(list(reversed(pathList)))
-                        # print(pathList.reverse())
                         return list(reversed(pathList))
-            if len(self.openList) == 0:
-                return None
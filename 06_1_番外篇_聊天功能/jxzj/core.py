@@ -1,7 +1,12 @@
+import json
+import os
+
 import pygame
 
-from astar import AStar
+from engine.chunk import WALK_FILE, WORLD_FILE, ChunkLoader
+from engine.interpolation import InterpolationBuffer
 from game_global import g
+from walk_map import WalkMap
 
 
 class Sprite:
@@ -26,51 +31,73 @@ class Sprite:
         dest.blit(source, (x, y), (cell_x * cell_w, cell_y * cell_h, cell_w, cell_h))
 
 
-class Array2D:
-    """
-        说明：
-            1.构造方法需要两个参数，即二维数组的宽和高
-            2.成员变量w和h是二维数组的宽和高
-            3.使用：‘对象[x][y]’可以直接取到相应的值
-            4.数组的默认值都是0
-    """
-
-    def __init__(self, w, h, default=0):
-        self.w = w
-        self.h = h
-        self.data = []
-        self.data = [[default for y in range(h)] for x in range(w)]
-
-    def show_array2d(self):
-        for y in range(self.h):
-            for x in range(self.w):
-                print(self.data[x][y], end=' ')
-            print("")
-
-    def __getitem__(self, item):
-        return self.data[item]
-
-
-class GameMap(Array2D):
+class GameMap(WalkMap):
     """
     游戏地图类
     """
+    TOP_TILE_SIZE = 128  # 上层图片按这个大小划分小块，完全透明的小块不绘制
 
-    def __init__(self, bottom, top, x, y):
+    def __init__(self, bottom, top, x, y, size=None):
+        """
+        :param bottom: 下层图片
+        :param top: 上层图片
+        :param size: 地图大小(宽,高)，单位像素，不传就使用图片的大小
+        """
+        if size is None:
+            size = (bottom.get_width(), top.get_height())
         # 将地图划分成w*h个小格子，每个格子32*32像素
-        w = int(bottom.get_width() / 32) + 1
-        h = int(top.get_height() / 32) + 1
+        w = int(size[0] / 32) + 1
+        h = int(size[1] / 32) + 1
         super().__init__(w, h)
         self.bottom = bottom
         self.top = top
+        self.width, self.height = size
         self.x = x
         self.y = y
+        self.top_tiles = self.opaque_tiles(top) if top else set()  # 上层图片中不透明的小块
+
+    def opaque_tiles(self, surface):
+        """
+        找出图片中有不透明像素的小块
+        :return: {(tx, ty)}
+        """
+        size = self.TOP_TILE_SIZE
+        mask = pygame.mask.from_surface(surface, 0)
+        tile = pygame.Mask((size, size), fill=True)
+        w, h = surface.get_size()
+        return {(tx, ty) for tx in range((w + size - 1) // size) for ty in range((h + size - 1) // size)
+                if mask.overlap(tile, (tx * size, ty * size))}
+
+    def view_rect(self, screen_surf):
+        """
+        当前窗口能看到的地图区域（地图坐标）
+        地图坐标可能是小数，这里与blit一样取整，保证分块绘制和整张绘制的结果一致
+        """
+        w, h = screen_surf.get_size()
+        return pygame.Rect(-int(self.x), -int(self.y), w, h).clip(pygame.Rect(0, 0, self.width, self.height))
+
+    def update(self, screen_surf):
+        """
+        每帧绘制前调用
+        :return: 地图自身有变化、需要重绘的窗口区域（整张图片的地图不会变化）
+        """
+        return []
 
     def draw_bottom(self, screen_surf):
-        screen_surf.blit(self.bottom, (self.x, self.y))
+        # 只绘制窗口能看到的部分
+        area = self.view_rect(screen_surf)
+        screen_surf.blit(self.bottom, (int(self.x) + area.x, int(self.y) + area.y), area)
 
     def draw_top(self, screen_surf):
-        screen_surf.blit(self.top, (self.x, self.y))
+        # 只绘制窗口能看到的、有不透明像素的小块
+        view = self.view_rect(screen_surf)
+        size = self.TOP_TILE_SIZE
+        for tx in range(view.left // size, (view.right - 1) // size + 1):
+            for ty in range(view.top // size, (view.bottom - 1) // size + 1):
+                if (tx, ty) not in self.top_tiles:
+                    continue
+                area = view.clip(pygame.Rect(tx * size, ty * size, size, size))
+                screen_surf.blit(self.top, (int(self.x) + area.x, int(self.y) + area.y), area)
 
     def draw_grid(self, screen_surf):
         """
@@ -92,28 +119,100 @@ class GameMap(Array2D):
         # print(role_x, role_y)
         if role_x < WIN_WIDTH / 2:
             self.x = 0
-        elif role_x > self.bottom.get_width() - WIN_WIDTH / 2:
-            self.x = -(self.bottom.get_width() - WIN_WIDTH)
+        elif role_x > self.width - WIN_WIDTH / 2:
+            self.x = -(self.width - WIN_WIDTH)
         else:
             self.x = -(role_x - WIN_WIDTH / 2)
 
         if role_y < WIN_HEIGHT / 2:
             self.y = 0
-        elif role_y > self.bottom.get_height() - WIN_HEIGHT / 2:
-            self.y = -(self.bottom.get_height() - WIN_HEIGHT)
+        elif role_y > self.height - WIN_HEIGHT / 2:
+            self.y = -(self.height - WIN_HEIGHT)
         else:
             self.y = -(role_y - WIN_HEIGHT / 2)
 
-    def load_walk_file(self, path):
+
+class ChunkedGameMap(GameMap):
+    """
+    分块地图类（目录结构见engine/chunk.py）
+        1.只绘制视野内的块，视野附近的块在后台线程预先加载
+        2.离开视野的块按LRU淘汰
+        3.可行走区域是整张mmap映射的二进制文件，由操作系统按需换入换出
+          不计算连通分量（要扫描整张地图），分层寻路的簇用到时才构建
+        4.块加载完成后，update()返回它在窗口上的区域，用来重绘
+    """
+
+    def __init__(self, path, x, y, capacity=64, margin=1):
         """
-        读取可行走区域文件
+        :param path: 分块地图目录
+        :param capacity: 最多缓存多少块
+        :param margin: 视野外预先加载几圈块
         """
-        with open(path, 'r') as file:
-            for x in range(self.w):
-                for y in range(self.h):
-                    v = int(file.readline())
-                    self[x][y] = v
-        # self.show_array2d()
+        with open(os.path.join(path, WORLD_FILE)) as file:
+            world = json.load(file)
+        super().__init__(None, None, x, y, size=(world['width'], world['height']))
+        self.path = path
+        self.chunk_size = world['chunk_size']
+        self.margin = margin
+        self.loader = ChunkLoader(self.load_chunk, self.prepare_chunk, capacity)
+        self.load_walk_file(os.path.join(path, WALK_FILE), components=False)
+
+    def load_chunk(self, key):
+        """
+        在后台线程中读取一块图片，文件不存在（完全透明的上层块）返回None
+        """
+        layer, cx, cy = key
+        file = os.path.join(self.path, layer, '%d_%d.png' % (cx, cy))
+        if not os.path.exists(file):
+            return None
+        return pygame.image.load(file)
+
+    @staticmethod
+    def prepare_chunk(surface):
+        return surface.convert_alpha()
+
+    def visible_chunks(self, screen_surf, margin=0):
+        """
+        视野内（向外扩展margin圈）的块坐标
+        """
+        size = self.chunk_size
+        screen_w, screen_h = screen_surf.get_size()
+        x0 = max(int(-self.x // size) - margin, 0)
+        y0 = max(int(-self.y // size) - margin, 0)
+        x1 = min(int((-self.x + screen_w - 1) // size) + margin, (self.width - 1) // size)
+        y1 = min(int((-self.y + screen_h - 1) // size) + margin, (self.height - 1) // size)
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def draw_layer(self, screen_surf, layer):
+        view = self.view_rect(screen_surf)
+        size = self.chunk_size
+        for cx, cy in self.visible_chunks(screen_surf):
+            surface = self.loader.get((layer, cx, cy))
+            if surface:
+                # 只绘制块中能看到的部分
+                area = view.clip(pygame.Rect(cx * size, cy * size, size, size)).move(-cx * size, -cy * size)
+                screen_surf.blit(surface, (int(self.x) + cx * size + area.x, int(self.y) + cy * size + area.y), area)
+
+    def update(self, screen_surf):
+        loaded = self.loader.update()
+        # 预先加载视野附近的块
+        for cx, cy in self.visible_chunks(screen_surf, self.margin):
+            self.loader.request(('bottom', cx, cy))
+            self.loader.request(('top', cx, cy))
+        # 刚加载完成的块，在窗口上能看到的部分需要重绘
+        size = self.chunk_size
+        rects = []
+        for _, cx, cy in loaded:
+            rect = pygame.Rect(int(self.x) + cx * size, int(self.y) + cy * size, size, size).clip(screen_surf.get_rect())
+            if rect:
+                rects.append(rect)
+        return rects
+
+    def draw_bottom(self, screen_surf):
+        self.draw_layer(screen_surf, 'bottom')
+
+    def draw_top(self, screen_surf):
+        self.draw_layer(screen_surf, 'top')
 
 
 class CharWalk:
@@ -143,11 +242,17 @@ class CharWalk:
         self.frame = 1  # 角色当前帧
         self.x = mx * 32  # 角色相对于地图的坐标
         self.y = my * 32
+        # 上次逻辑更新前的坐标，绘制时在两次逻辑更新之间插值
+        self.prev_x = self.x
+        self.prev_y = self.y
+        # 绘制的坐标（见interpolate）
+        self.draw_x = self.x
+        self.draw_y = self.y
         # 角色下一步需要去的格子
         self.next_mx = 0
         self.next_my = 0
         # 步长
-        self.step = 2  # 每帧移动的像素
+        self.step = 2  # 每次逻辑更新移动的像素
         # 寻路路径
         self.path = []
         # 当前路径下标
@@ -156,7 +261,27 @@ class CharWalk:
     def draw(self, screen_surf, map_x, map_y):
         cell_x = self.char_id % 12 + int(self.frame)
         cell_y = self.char_id // 12 + self.dir
-        Sprite.draw(screen_surf, self.hero_surf, map_x + self.x, map_y + self.y, cell_x, cell_y)
+        Sprite.draw(screen_surf, self.hero_surf, map_x + self.draw_x, map_y + self.draw_y, cell_x, cell_y)
+
+    def rect(self, map_x, map_y):
+        """
+        角色在窗口上绘制的范围
+        """
+        return pygame.Rect(int(map_x + self.draw_x), int(map_y + self.draw_y), 32, 32)
+
+    def interpolate(self, alpha):
+        """
+        计算绘制的坐标（每次绘制前调用）
+        :param alpha: 距离上次逻辑更新过去了多少个逻辑更新间隔（0~1）
+        """
+        self.draw_x = self.prev_x + (self.x - self.prev_x) * alpha
+        self.draw_y = self.prev_y + (self.y - self.prev_y) * alpha
+
+    def draw_state(self):
+        """
+        影响绘制结果的状态（精灵图中的格子），没有变化就不需要重绘
+        """
+        return self.char_id, int(self.frame), self.dir
 
     def goto(self, x, y):
         """
@@ -179,9 +304,18 @@ class CharWalk:
 
         self.is_walking = True
 
-        # 告诉服务端自己移动了(其他玩家也属于player对象噢，所以这里得避免一下other_player里面的player也调用这个方法)
-        if g.player is self:
-            g.client.move(self)
+    def set_position(self, mx, my):
+        """
+        停止行走，直接放到(mx,my)格子上（服务端纠正位置时使用）
+        """
+        self.mx = self.next_mx = mx
+        self.my = self.next_my = my
+        self.x = self.prev_x = mx * 32
+        self.y = self.prev_y = my * 32
+        self.is_walking = False
+        self.frame = 1
+        self.path = []
+        self.path_index = 0
 
     def move(self):
         if not self.is_walking:
@@ -221,6 +355,8 @@ class CharWalk:
             self.is_walking = False
 
     def logic(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
         self.move()
 
         # 如果角色正在移动，就不管它了
@@ -241,14 +377,20 @@ class CharWalk:
         :param map2d: 地图
         :param end_point: 寻路终点
         """
-        start_point = (self.mx, self.my)
-        path = AStar(map2d, start_point, end_point).start()
+        # 正在走向下一个格子的话，要走完这一格才会开始新的路径，所以从下一个格子开始寻路
+        start_point = (self.next_mx, self.next_my) if self.is_walking else (self.mx, self.my)
+        path = map2d.find_path(start_point, end_point)
         if path is None:
             return
 
         self.path = path
         self.path_index = 0
 
+        # 只把起点终点告诉服务端，服务端用同样的地图和寻路算法算出同样的路径
+        # (其他玩家也属于player对象噢，所以这里得避免一下other_player里面的player也调用这个方法)
+        if g.player is self:
+            g.client.goto(start_point, end_point)
+
 
 class Player(CharWalk):
     """
@@ -258,4 +400,124 @@ class Player(CharWalk):
     def __init__(self, *args, **kwargs):
         self.name = kwargs['name']  # 昵称
         self.uuid = kwargs['uuid']  # uuid 玩家的唯一标识
+        self.eid = kwargs.get('eid')  # 服务端分配的实体编号，同步协议中用它代替uuid
+        super().__init__(*args, **kwargs)
+
+
+class RemotePlayer(Player):
+    """
+    其他玩家，位置由服务端同步
+        收到的位置带有服务端时间，绘制时取INTERP_DELAY秒之前的位置，在前后两个位置之间插值（见engine.interpolation）
+        服务端发送快照的间隔比较长，或者包晚到、几个包一起到，移动都是平滑的
+    """
+    INTERP_DELAY = 0.2  # 插值延迟（秒），要比服务端发送快照的间隔长
+    MAX_EXTRAPOLATION = 0.1  # 收不到新位置时最多外推多长时间（秒）
+
+    def __init__(self, *args, **kwargs):
+        """
+        :param clock: ServerClock对象，估算服务端当前时间
+        """
+        self.clock = kwargs['clock']
         super().__init__(*args, **kwargs)
+        self.buffer = InterpolationBuffer(self.MAX_EXTRAPOLATION)
+        self.buffer.push(0, self.x, self.y)
+
+    def push_position(self, server_time, mx, my, stop=False, continuous=False):
+        """
+        服务端时间为server_time时，角色在(mx,my)格子上
+        :param stop: 角色会停在这里（比如路径的终点），不需要外推
+        :param continuous: 从上一个位置一直匀速走过来的
+        """
+        self.buffer.push(server_time, mx * 32, my * 32, stop, continuous)
+
+    def follow_path(self, server_time, step_time, start, waypoints):
+        """
+        服务端发来了路径，按走一格的时间换算成每个拐点的到达时间（拐点之间是匀速直线运动，插值就是逐格行走）
+        :param server_time: 角色在起点的服务端时间
+        :param step_time: 走一格的时间（秒）
+        :param start: 起点
+        :param waypoints: 拐点列表，最后一个是终点
+        """
+        self.push_position(server_time, *start, stop=not waypoints)
+        x, y = start
+        for index, (mx, my) in enumerate(waypoints, 1):
+            server_time += (abs(mx - x) + abs(my - y)) * step_time
+            x, y = mx, my
+            self.push_position(server_time, mx, my, stop=index == len(waypoints), continuous=True)
+
+    def logic(self):
+        self.prev_x = self.x
+        self.prev_y = self.y
+        now = self.clock.now()
+        if now is None:
+            return
+        x, y = self.buffer.sample(now - self.INTERP_DELAY)
+        dx = x - self.x
+        dy = y - self.y
+        self.is_walking = dx != 0 or dy != 0
+        if self.is_walking:
+            # 设置人物面向
+            if abs(dx) > abs(dy):
+                self.dir = CharWalk.DIR_RIGHT if dx > 0 else CharWalk.DIR_LEFT
+            else:
+                self.dir = CharWalk.DIR_DOWN if dy > 0 else CharWalk.DIR_UP
+            self.frame = (self.frame + 0.1) % 3
+        else:
+            self.frame = 1
+        self.x = x
+        self.y = y
+        self.mx = int(x / 32)
+        self.my = int(y / 32)
+
+
+class PlayerRegistry:
+    """
+    其他玩家的集合
+        1.按uuid和实体编号索引，添加、删除、查找都是O(1)
+        2.遍历时按加入的顺序（绘制顺序不变）
+    """
+
+    def __init__(self):
+        self.players = {}  # uuid -> Player
+        self.eids = {}  # 实体编号 -> Player
+
+    def __iter__(self):
+        # 遍历副本，遍历过程中添加、删除玩家不会出错
+        return iter(list(self.players.values()))
+
+    def __len__(self):
+        return len(self.players)
+
+    def __contains__(self, uuid):
+        return uuid in self.players
+
+    def get(self, uuid):
+        """
+        :return: Player对象，不存在返回None
+        """
+        return self.players.get(uuid)
+
+    def get_eid(self, eid):
+        """
+        :return: 实体编号为eid的Player对象，不存在返回None
+        """
+        return self.eids.get(eid)
+
+    def add(self, player):
+        """
+        添加玩家，uuid相同的旧玩家会被替换
+        """
+        self.remove(player.uuid)
+        self.players[player.uuid] = player
+        if player.eid is not None:
+            self.eids[player.eid] = player
+
+    def remove(self, uuid):
+        """
+        删除玩家
+        :return: 被删除的Player对象，不存在返回None
+        """
+        player = self.players.pop(uuid, None)
+        if player and self.eids.get(player.eid) is player:
+            del self.eids[player.eid]
+        return player
@@ -1,3 +1,11 @@
+import heapq
+import re
+from array import array
+from collections import deque
+
+from engine.common import Array2D
+
+
 class Point:
     """
     表示一个点
@@ -12,6 +20,9 @@ class Point:
             return True
         return False
 
+    def __hash__(self):
+        return hash((self.x, self.y))
+
     def __str__(self):
         return "x:" + str(self.x) + ",y:" + str(self.y)
 
@@ -19,10 +30,303 @@ class Point:
         return "x:" + str(self.x) + ",y:" + str(self.y)
 
 
+class ConnectedComponents:
+    """
+    可行走区域的连通分量标记
+        1.每个可行走格子都有一个连通分量编号（从1开始），障碍的编号为0
+        2.编号相同的两个格子一定能走通，判断终点能否到达是O(1)的
+        3.标记时把每一列切成连续可行走的线段，相邻两列挨着的线段用并查集合并，不用逐格搜索
+        4.地图修改后调用update()，只有真的连起来或者分开了才重新标记，而且只标记较小的那部分
+    """
+    RING = [(-1, -1), (0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0)]  # 周围8格，按顺时针排列
+
+    def __init__(self, map2d, passTag=0, diagonal=True):
+        """
+        :param map2d: Array2D类型的寻路数组
+        :param passTag: int类型的可行走标记（若地图数据!=passTag即为障碍）
+        :param diagonal: 是否八方向连通（对应AStar的八方寻路，offset为1）
+        """
+        self.map2d = map2d
+        self.passTag = passTag
+        self.diagonal = diagonal
+        if diagonal:
+            self.near = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, 1), (-1, 1), (1, -1)]
+        else:
+            self.near = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+        self.pattern = None  # 一列中连续的可行走格子（每个格子1字节时使用）
+        if 0 <= passTag < 256:
+            self.pattern = re.compile(re.escape(bytes((passTag,))) + b'+')
+        self.labels = None
+        self.sizes = {}  # 连通分量编号 -> 格子数
+        self.count = 0  # 已经用过的编号
+        self.build()
+
+    def column_runs(self, x):
+        """
+        :return: 第x列中连续可行走的线段的起点列表和终点列表（终点不包括在线段内）
+        """
+        column = self.map2d[x]
+        if self.pattern and getattr(column, 'format', None) == 'B':
+            # 每个格子1字节，用正则表达式在字节串中找，不用逐格判断
+            spans = [match.span() for match in self.pattern.finditer(column.tobytes())]
+        else:
+            spans = []
+            start = None
+            for y, value in enumerate(column):
+                if value == self.passTag:
+                    if start is None:
+                        start = y
+                elif start is not None:
+                    spans.append((start, y))
+                    start = None
+            if start is not None:
+                spans.append((start, len(column)))
+        return [span[0] for span in spans], [span[1] for span in spans]
+
+    def build(self):
+        """
+        重新标记整张地图
+        """
+        w, h = self.map2d.w, self.map2d.h
+        touch = 1 if self.diagonal else 0  # 八方向时斜着挨着的线段也是连通的
+        parent = []  # 并查集，每条线段一个元素
+        columns = []  # 每一列的线段 (第一条线段的编号, 起点列表, 终点列表)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = i = parent[parent[i]]
+            return i
+
+        prev_starts = prev_ends = ()
+        prev_base = 0
+        for x in range(w):
+            starts, ends = self.column_runs(x)
+            base = len(parent)
+            parent.extend(range(base, base + len(starts)))
+            columns.append((base, starts, ends))
+            # 两列的线段都是从上到下排列的，同时往下扫描，找出挨着的线段合并
+            i = j = 0
+            prev_count, count = len(prev_starts), len(starts)
+            while i < prev_count and j < count:
+                prev_end, end = prev_ends[i], ends[j]
+                if prev_starts[i] < end + touch and starts[j] < prev_end + touch:
+                    a = find(prev_base + i)
+                    b = find(base + j)
+                    if a != b:
+                        parent[b] = a
+                if prev_end <= end:
+                    i += 1
+                if end <= prev_end:
+                    j += 1
+            prev_starts, prev_ends, prev_base = starts, ends, base
+
+        self.labels = Array2D(w, h, typecode='i')
+        sizes = self.sizes = {}
+        label_of = {}  # 并查集的根 -> 连通分量编号
+        view = self.labels.view
+        for x, (base, starts, ends) in enumerate(columns):
+            offset = x * h
+            for index, (start, end) in enumerate(zip(starts, ends), base):
+                root = find(index)
+                label = label_of.get(root)
+                if label is None:
+                    label = label_of[root] = len(label_of) + 1
+                    sizes[label] = 0
+                view[offset + start:offset + end] = array('i', (label,)) * (end - start)
+                sizes[label] += end - start
+        self.count = len(label_of)
+
+    def passable(self, x, y):
+        return 0 <= x < self.map2d.w and 0 <= y < self.map2d.h and self.map2d[x][y] == self.passTag
+
+    def fill(self, x, y, label):
+        """
+        从(x,y)开始，把它所在的连通分量中编号不是label的格子都标记为label
+        :return: 标记了多少个格子
+        """
+        labels = self.labels
+        labels[x][y] = label
+        count = 1
+        stack = [(x, y)]
+        while stack:
+            x, y = stack.pop()
+            for dx, dy in self.near:
+                nx, ny = x + dx, y + dy
+                if self.passable(nx, ny) and labels[nx][ny] != label:
+                    labels[nx][ny] = label
+                    count += 1
+                    stack.append((nx, ny))
+        return count
+
+    def update(self, x, y):
+        """
+        格子(x,y)的可行走状态改变了
+        """
+        if self.map2d[x][y] == self.passTag:
+            self.opened(x, y)
+        else:
+            self.closed(x, y)
+
+    def opened(self, x, y):
+        """
+        (x,y)变成可行走：周围有几个连通分量就把它们连起来，重新标记较小的那几个
+        """
+        if self.labels[x][y]:
+            return
+        around = {self.labels[nx][ny] for nx, ny in self.near_cells(x, y)} - {0}
+        if not around:
+            self.count += 1
+            self.labels[x][y] = self.count
+            self.sizes[self.count] = 1
+            return
+        largest = max(around, key=self.sizes.get)
+        self.labels[x][y] = largest
+        self.sizes[largest] += 1
+        for label in around - {largest}:
+            self.sizes[largest] += self.sizes.pop(label)
+        if len(around) > 1:
+            self.fill(x, y, largest)
+
+    def closed(self, x, y):
+        """
+        (x,y)变成障碍：原来的连通分量可能被分成几块
+            1.周围挨着的格子在这一圈8格中连在一起的话，肯定没有分开
+            2.否则从每一块同时开始搜索，碰到一起的合并，先搜索完的就是被分出去的一块，给它一个新编号
+              最后剩下的一块（最大的）保持原来的编号，不用搜索完
+        """
+        old = self.labels[x][y]
+        if old == 0:
+            return
+        self.labels[x][y] = 0
+        self.sizes[old] -= 1
+        seeds = self.ring_groups(x, y, old)
+        if len(seeds) < 2:
+            if self.sizes[old] == 0:
+                del self.sizes[old]
+            return
+
+        # 每一块的搜索状态：已经搜索到的格子、待搜索的格子（格子用下标x*h+y表示）
+        w, h = self.map2d.w, self.map2d.h
+        labels = self.labels.view
+        steps = [dx * h + dy for dx, dy in self.near]
+        owner = {}  # 格子 -> 所属的块
+        group = list(range(len(seeds)))  # 块合并后指向合并到的块
+        visited = []
+        queues = []
+        for index, (sx, sy) in enumerate(seeds):
+            owner[sx * h + sy] = index
+            visited.append([sx * h + sy])
+            queues.append(deque(visited[-1]))
+
+        def root(i):
+            while group[i] != i:
+                i = group[i]
+            return i
+
+        active = set(range(len(seeds)))
+        while len(active) > 1:
+            for index in list(active):
+                if index not in active:
+                    continue
+                queue = queues[index]
+                if not queue:
+                    # 搜索完了还没碰到其他块，说明被分出去了
+                    active.discard(index)
+                    self.count += 1
+                    for cell in visited[index]:
+                        labels[cell] = self.count
+                    self.sizes[self.count] = len(visited[index])
+                    self.sizes[old] -= len(visited[index])
+                    continue
+                cell = queue.popleft()
+                cy = cell % h
+                for step, (dx, dy) in zip(steps, self.near):
+                    ny = cy + dy
+                    near = cell + step
+                    if not (0 <= ny < h and 0 <= near < w * h) or labels[near] != old:
+                        continue
+                    other = owner.get(near)
+                    if other is None:
+                        owner[near] = index
+                        visited[index].append(near)
+                        queue.append(near)
+                        continue
+                    other = root(other)
+                    if other != index:
+                        # 两块碰到一起了，合并成一块
+                        group[other] = index
+                        visited[index] += visited[other]
+                        queue.extend(queues[other])
+                        visited[other] = []
+                        queues[other] = deque()
+                        active.discard(other)
+                if len(active) < 2:
+                    break
+
+    def near_cells(self, x, y):
+        for dx, dy in self.near:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.map2d.w and 0 <= ny < self.map2d.h:
+                yield nx, ny
+
+    def ring_groups(self, x, y, label):
+        """
+        把(x,y)周围编号为label的相邻格子按周围一圈8格中的连通性分组
+        :return: 每组取一个格子
+        """
+        ring = []
+        for dx, dy in self.RING:
+            nx, ny = x + dx, y + dy
+            inside = 0 <= nx < self.map2d.w and 0 <= ny < self.map2d.h
+            ring.append((nx, ny) if inside and self.labels[nx][ny] == label else None)
+        if all(ring):
+            return [ring[0]]
+        # 从一个不属于label的位置开始转一圈，连续的一段是一组
+        start = ring.index(None)
+        seeds = []
+        seed = None
+        for i in range(1, 9):
+            cell = ring[(start + i) % 8]
+            if cell is None:
+                if seed:
+                    seeds.append(seed)
+                seed = None
+                continue
+            # 四方向时只有上下左右是相邻的，角上的格子只用来把两边连起来
+            dx, dy = cell[0] - x, cell[1] - y
+            if seed is None and (self.diagonal or dx == 0 or dy == 0):
+                seed = cell
+        if seed:
+            seeds.append(seed)
+        return seeds
+
+    def label(self, x, y):
+        return self.labels[x][y]
+
+    def connected(self, startPoint, endPoint):
+        """
+        两个点是否能走通（起点是障碍时返回False，这时要不要寻路由调用者决定）
+        :param startPoint: Point或二元组类型
+        :param endPoint: Point或二元组类型
+        """
+        if isinstance(startPoint, Point):
+            startPoint = (startPoint.x, startPoint.y)
+        if isinstance(endPoint, Point):
+            endPoint = (endPoint.x, endPoint.y)
+        label = self.labels[startPoint[0]][startPoint[1]]
+        return label != 0 and label == self.labels[endPoint[0]][endPoint[1]]
+
+
 class AStar:
     """
     AStar算法的Python3.x实现
+        1.开启表使用二叉堆（heapq），取F值最小的节点是O(logn)
+        2.开启表、关闭表都额外用以(x,y)为键的dict/set做索引，判断一个点在不在表中是O(1)
+        3.堆中的节点F值变小时不删除旧记录，而是重新入堆，旧记录出堆时直接跳过（惰性删除）
+        4.jumpPointSearch()为跳点搜索（JPS）模式，只适用于每格花费相同的地图，返回的路径格式与start()一样
+        5.传入ConnectedComponents时，走不到的终点直接返回None，不会把整个连通区域都搜一遍
     """
+    LINE_SCAN_MIN = 50  # 地图宽高都不小于这个值时，跳点搜索才用正则表达式扫描行、列（短的行列逐格扫描更快）
 
     class Node:  # 描述AStar算法中的节点数据
         def __init__(self, point, endPoint, g=0):
@@ -30,19 +334,25 @@ class AStar:
             self.father = None  # 父节点
             self.g = g  # g值，g值在用到的时候会重新算
             self.h = (abs(endPoint.x - point.x) + abs(endPoint.y - point.y)) * 10  # 计算h值
+            self.seq = 0  # 进入开启表的顺序，F值相同时先进入的先出来
 
-    def __init__(self, map2d, startPoint, endPoint, passTag=0, offset=1):
+    def __init__(self, map2d, startPoint, endPoint, passTag=0, offset=1, components=None):
         """
         构造AStar算法的启动条件
         :param map2d: Array2D类型的寻路数组
         :param startPoint: Point或二元组类型的寻路起点
         :param endPoint: Point或二元组类型的寻路终点
         :param passTag: int类型的可行走标记（若地图数据!=passTag即为障碍）
+        :param components: ConnectedComponents类型的连通分量标记（八方向），offset为1时才会使用
         """
-        # 开启表
+        # 开启表（二叉堆，元素为(F值, 入表顺序, 节点)）
         self.openList = []
-        # 关闭表
-        self.closeList = []
+        # 开启表索引 (x,y)->节点
+        self.openDict = {}
+        # 关闭表 {(x,y)}
+        self.closeSet = set()
+        # 入表计数器
+        self.seq = 0
         # 寻路地图
         self.map2d = map2d
         # 起点终点
@@ -57,35 +367,54 @@ class AStar:
         self.passTag = passTag
         # 遍历周围格子的偏移量
         self.offset = offset
+        # 连通分量标记
+        self.components = components
+
+    def pushNode(self, node):
+        """
+        把节点放入开启表
+        """
+        if node.seq == 0:
+            self.seq += 1
+            node.seq = self.seq
+            self.openDict[(node.point.x, node.point.y)] = node
+        heapq.heappush(self.openList, (node.g + node.h, node.seq, node))
 
     def getMinNode(self):
         """
-        获得openlist中F值最小的节点
-        :return: Node
+        获得openlist中F值最小的节点，并把它从openlist中删除
+        :return: Node或None（开启表为空）
         """
-        currentNode = self.openList[0]
-        for node in self.openList:
-            if node.g + node.h < currentNode.g + currentNode.h:
-                currentNode = node
-        return currentNode
+        while self.openList:
+            f, _, node = heapq.heappop(self.openList)
+            key = (node.point.x, node.point.y)
+            # 已经在关闭表中，或者是g值更新前留下的旧记录，跳过
+            if key in self.closeSet or f != node.g + node.h:
+                continue
+            del self.openDict[key]
+            return node
+        return None
 
-    def pointInCloseList(self, point):
-        for node in self.closeList:
-            if node.point == point:
-                return True
+    def unreachable(self):
+        """
+        终点是否一定走不到
+        """
+        if self.map2d[self.endPoint.x][self.endPoint.y] != self.passTag:
+            return True
+        # 起点是障碍时（比如出生点）不属于任何连通分量，判断不了，直接寻路
+        if self.components and self.offset == 1 and \
+                self.map2d[self.startPoint.x][self.startPoint.y] == self.passTag:
+            return not self.components.connected(self.startPoint, self.endPoint)
         return False
 
+    def pointInCloseList(self, point):
+        return (point.x, point.y) in self.closeSet
+
     def pointInOpenList(self, point):
-        for node in self.openList:
-            if node.point == point:
-                return node
-        return None
+        return self.openDict.get((point.x, point.y))
 
     def endPointInCloseList(self):
-        for node in self.openList:
-            if node.point == self.endPoint:
-                return node
-        return None
+        return self.openDict.get((self.endPoint.x, self.endPoint.y))
 
     def searchNear(self, minF, offsetX, offsetY):
         """
@@ -95,15 +424,16 @@ class AStar:
         :param offsetY:
         :return:
         """
+        x = minF.point.x + offsetX
+        y = minF.point.y + offsetY
         # 越界检测
-        if minF.point.x + offsetX < 0 or minF.point.x + offsetX > self.map2d.w - 1 or minF.point.y + offsetY < 0 or minF.point.y + offsetY > self.map2d.h - 1:
+        if x < 0 or x > self.map2d.w - 1 or y < 0 or y > self.map2d.h - 1:
             return
         # 如果是障碍，就忽略
-        if self.map2d[minF.point.x + offsetX][minF.point.y + offsetY] != self.passTag:
+        if self.map2d[x][y] != self.passTag:
             return
         # 如果在关闭表中，就忽略
-        currentPoint = Point(minF.point.x + offsetX, minF.point.y + offsetY)
-        if self.pointInCloseList(currentPoint):
+        if (x, y) in self.closeSet:
             return
         # 设置单位花费
         if offsetX == 0 or offsetY == 0:
@@ -111,40 +441,41 @@ class AStar:
         else:
             step = 14
         # 如果不再openList中，就把它加入openlist
-        currentNode = self.pointInOpenList(currentPoint)
+        currentNode = self.openDict.get((x, y))
         if not currentNode:
-            currentNode = AStar.Node(currentPoint, self.endPoint, g=minF.g + step)
+            currentNode = AStar.Node(Point(x, y), self.endPoint, g=minF.g + step)
             currentNode.father = minF
-            self.openList.append(currentNode)
+            self.pushNode(currentNode)
             return
         # 如果在openList中，判断minF到当前点的G是否更小
-        if minF.g + step < currentNode.g:  # 如果更小，就重新计算g值，并且改变father
+        if minF.g + step < currentNode.g:  # 如果更小，就重新计算g值，并且改变father，然后重新入堆
             currentNode.g = minF.g + step
             currentNode.father = minF
+            self.pushNode(currentNode)
 
     def start(self):
         """
         开始寻路
         :return: None或Point列表（路径）
         """
-        # 判断寻路终点是否是障碍
-        if self.map2d[self.endPoint.x][self.endPoint.y] != self.passTag:
+        # 判断寻路终点是否是障碍、是否能走到
+        if self.unreachable():
+            return None
+        # 起点就是终点，不需要走
+        if self.startPoint == self.endPoint:
             return None
 
         # 1.将起点放入开启列表
         startNode = AStar.Node(self.startPoint, self.endPoint)
-        self.openList.append(startNode)
+        self.pushNode(startNode)
         # 2.主循环逻辑
-        count = 0
         while True:
-            count += 1
-            if count > 400:
-                return None
-            # 找到F值最小的点
+            # 找到F值最小的点，并且在openList中删除它
             minF = self.getMinNode()
-            # 把这个点加入closeList中，并且在openList中删除它
-            self.closeList.append(minF)
-            self.openList.remove(minF)
+            if minF is None:
+                return None
+            # 把这个点加入closeList中
+            self.closeSet.add((minF.point.x, minF.point.y))
             # 判断这个节点的上下左右节点，八方寻路
             self.searchNear(minF, 0, -self.offset)  # 上
             self.searchNear(minF, 0, self.offset)  # 下
@@ -167,5 +498,243 @@ class AStar:
                         cPoint = cPoint.father
                     else:
                         return list(reversed(pathList))
-            if len(self.openList) == 0:
+
+    def walkable(self, x, y):
+        """
+        坐标是否在地图内且可以行走
+        """
+        return 0 <= x < self.map2d.w and 0 <= y < self.map2d.h and self.map2d[x][y] == self.passTag
+
+    def octile(self, x, y):
+        """
+        八方向的估值函数（直走10，斜走14）
+        """
+        dx = abs(self.endPoint.x - x) // self.offset
+        dy = abs(self.endPoint.y - y) // self.offset
+        return 10 * (dx + dy) - 6 * min(dx, dy)
+
+    def lineGroup(self, vertical, index, forward):
+        """
+        沿一行或一列跳跃时要扫描的数据，forward为False时倒过来，向左、向上扫描时也是从前往后找
+        :return: (这一行或列, [两侧的行或列])，都是bytes，同一次寻路中缓存在self.groups中
+        """
+        view, w, h, lines = self.map2d.view, self.map2d.w, self.map2d.h, self.lines
+        group = []
+        for i in (index, index + 1, index - 1):
+            if not 0 <= i < (w if vertical else h):
+                continue
+            key = (vertical, i, forward)
+            data = lines.get(key)
+            if data is None:
+                data = view[i * h:(i + 1) * h] if vertical else view[i::h]
+                data = lines[key] = data.tobytes() if forward else data.tobytes()[::-1]
+            group.append(data)
+        group = self.groups[(vertical, index, forward)] = group[0], group[1:]
+        return group
+
+    def jumpStraight(self, x, y, dx, dy):
+        """
+        沿直线跳跃，返回跳点坐标，没有跳点返回None
+        """
+        if self.groups is not None:
+            # 在行、列的字节串中用正则表达式找，下标都换算成从前往后的方向
+            if dx:
+                forward, key, start = dx > 0, (False, y, dx > 0), x
+                target = self.endPoint.x if y == self.endPoint.y else None
+            else:
+                forward, key, start = dy > 0, (True, x, dy > 0), y
+                target = self.endPoint.y if x == self.endPoint.x else None
+            line, sides = self.groups.get(key) or self.lineGroup(*key)
+            last = len(line) - 1
+            if not forward:
+                start = last - start
+                if target is not None:
+                    target = last - target
+            match = self.blocked.search(line, start + 1)
+            stop = match.start() if match else last + 1
+            found = None
+            if target is not None and start < target < stop:
+                stop = found = target
+            for side in sides:
+                # 两侧的格子是障碍而下一格能走，就是强迫邻居，只找比stop更近的
+                match = self.forced.search(side, start + 1, stop + 1)
+                if match:
+                    stop = found = match.start()
+            if found is None:
                 return None
+            if not forward:
+                found = last - found
+            return (found, y) if dx else (x, found)
+
+        # 这里是跳点搜索最热的循环，把walkable展开，列从self.columns中取，两侧的格子在循环外先算好
+        columns, w, h, passTag, o = self.columns, self.map2d.w, self.map2d.h, self.passTag, self.offset
+        if dx:
+            # 水平方向，检查上下两侧
+            target = self.endPoint.x if y == self.endPoint.y else None
+            sides = [sy for sy in (y + o, y - o) if 0 <= sy < h]
+            for x in range(x + dx, w if dx > 0 else -1, dx):
+                col = columns[x]
+                if col[y] != passTag:
+                    return None
+                if x == target:
+                    return x, y
+                nx = x + dx
+                if 0 <= nx < w:
+                    next_col = columns[nx]
+                    for sy in sides:
+                        if col[sy] != passTag and next_col[sy] == passTag:
+                            return x, y
+            return None
+        # 垂直方向，检查左右两侧
+        target = self.endPoint.y if x == self.endPoint.x else None
+        sides = [columns[sx] for sx in (x + o, x - o) if 0 <= sx < w]
+        col = columns[x]
+        for y in range(y + dy, h if dy > 0 else -1, dy):
+            if col[y] != passTag:
+                return None
+            if y == target:
+                return x, y
+            ny = y + dy
+            if 0 <= ny < h:
+                for side in sides:
+                    if side[y] != passTag and side[ny] == passTag:
+                        return x, y
+        return None
+
+    def jump(self, x, y, dx, dy):
+        """
+        从(x,y)沿(dx,dy)方向跳跃，返回跳点坐标，没有跳点返回None
+        """
+        if not dx or not dy:
+            return self.jumpStraight(x, y, dx, dy)
+        columns, w, h, passTag = self.columns, self.map2d.w, self.map2d.h, self.passTag
+        end_x, end_y = self.endPoint.x, self.endPoint.y
+        jumpStraight = self.jumpStraight
+        while True:
+            back, py = columns[x], y
+            x += dx
+            y += dy
+            if not (0 <= x < w and 0 <= y < h):
+                return None
+            col = columns[x]
+            if col[y] != passTag:
+                return None
+            if x == end_x and y == end_y:
+                return x, y
+            # 强迫邻居：(x-dx,y)是障碍而(x-dx,y+dy)能走，或者(x,y-dy)是障碍而(x+dx,y-dy)能走
+            # 与searchNear一致，斜着走时不检查两侧的格子是否是障碍
+            ny = y + dy
+            if back[y] != passTag and 0 <= ny < h and back[ny] == passTag:
+                return x, y
+            nx = x + dx
+            if col[py] != passTag and 0 <= nx < w and columns[nx][py] == passTag:
+                return x, y
+            # 水平或垂直方向能找到跳点，当前点就是跳点；垂直方向只在一列内扫描，比较快，先扫
+            if jumpStraight(x, y, 0, dy) or jumpStraight(x, y, dx, 0):
+                return x, y
+
+    def jumpDirections(self, node):
+        """
+        节点需要继续搜索的方向（自然邻居+强迫邻居）
+        """
+        o = self.offset
+        if not node.father:
+            return [(dx, dy) for dx in (-o, 0, o) for dy in (-o, 0, o) if dx or dy]
+        x, y = node.point.x, node.point.y
+        dx = (x > node.father.point.x) - (x < node.father.point.x)
+        dy = (y > node.father.point.y) - (y < node.father.point.y)
+        dx *= o
+        dy *= o
+        walkable = self.walkable
+        if dx and dy:
+            dirs = [(dx, 0), (0, dy), (dx, dy)]
+            if not walkable(x - dx, y):
+                dirs.append((-dx, dy))
+            if not walkable(x, y - dy):
+                dirs.append((dx, -dy))
+        elif dx:
+            dirs = [(dx, 0)]
+            if not walkable(x, y + o):
+                dirs.append((dx, o))
+            if not walkable(x, y - o):
+                dirs.append((dx, -o))
+        else:
+            dirs = [(0, dy)]
+            if not walkable(x + o, y):
+                dirs.append((o, dy))
+            if not walkable(x - o, y):
+                dirs.append((-o, dy))
+        return dirs
+
+    def jumpPointSearch(self):
+        """
+        跳点搜索（Jump Point Search）
+        对称的路径只展开跳点，长距离寻路展开的节点数比start()少得多
+        :return: None或Point列表（路径，与start()一样是逐格的）
+        """
+        # 判断寻路终点是否是障碍、是否能走到
+        if self.unreachable():
+            return None
+        # 起点就是终点，不需要走
+        if self.startPoint == self.endPoint:
+            return None
+
+        # 每一列只取一次，跳跃时不用再调用map2d[x]
+        self.columns = [self.map2d[x] for x in range(self.map2d.w)]
+        # 每个格子1字节的Array2D，直线跳跃用正则表达式在行、列的字节串中找，不用逐格判断
+        self.groups = None
+        view = getattr(self.map2d, 'view', None)
+        if self.offset == 1 and 0 <= self.passTag < 256 and getattr(view, 'format', None) == 'B' and \
+                min(self.map2d.w, self.map2d.h) >= self.LINE_SCAN_MIN:
+            tag = re.escape(bytes((self.passTag,)))
+            self.blocked = re.compile(b'[^' + tag + b']')
+            self.forced = re.compile(b'[^' + tag + b']' + tag)
+            self.lines = {}  # (是否是列, 下标, 是否正向) -> bytes
+            self.groups = {}  # (是否是列, 下标, 是否正向) -> (这一行或列, [两侧的行或列])
+        startNode = AStar.Node(self.startPoint, self.endPoint)
+        startNode.h = self.octile(self.startPoint.x, self.startPoint.y)
+        self.pushNode(startNode)
+        while True:
+            minF = self.getMinNode()
+            if minF is None:
+                return None
+            if minF.point == self.endPoint:
+                return self.jumpPath(minF)
+            self.closeSet.add((minF.point.x, minF.point.y))
+            for dx, dy in self.jumpDirections(minF):
+                jumpPoint = self.jump(minF.point.x, minF.point.y, dx, dy)
+                if jumpPoint is None or jumpPoint in self.closeSet:
+                    continue
+                # 跳点之间都是直线或斜线
+                distX = abs(jumpPoint[0] - minF.point.x) // self.offset
+                distY = abs(jumpPoint[1] - minF.point.y) // self.offset
+                g = minF.g + 10 * (distX + distY) - 6 * min(distX, distY)
+                currentNode = self.openDict.get(jumpPoint)
+                if not currentNode:
+                    currentNode = AStar.Node(Point(*jumpPoint), self.endPoint, g=g)
+                    currentNode.h = self.octile(*jumpPoint)
+                    currentNode.father = minF
+                    self.pushNode(currentNode)
+                elif g < currentNode.g:
+                    currentNode.g = g
+                    currentNode.father = minF
+                    self.pushNode(currentNode)
+
+    def jumpPath(self, node):
+        """
+        把跳点组成的路径展开成逐格的路径
+        """
+        pathList = []
+        while node.father:
+            x, y = node.point.x, node.point.y
+            fx, fy = node.father.point.x, node.father.point.y
+            dx = ((fx > x) - (fx < x)) * self.offset
+            dy = ((fy > y) - (fy < y)) * self.offset
+            while x != fx or y != fy:
+                pathList.append(Point(x, y))
+                if x != fx:
+                    x += dx
+                if y != fy:
+                    y += dy
+            node = node.father
+        return list(reversed(pathList))
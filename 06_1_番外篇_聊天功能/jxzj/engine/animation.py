@@ -20,6 +20,7 @@ class Animation:
         :param frame_range:动画帧范围,第一帧为0，比如[0,3]为4帧 [1,3]为3帧
         :param frame_callback:帧回调
         :param done_callback:完成回调
+        :param fps:每秒调用多少次update()，update()应该在固定频率的逻辑更新中调用，和绘制的帧率无关
         """
         self.x = x
         self.y = y
@@ -40,7 +41,7 @@ class Animation:
         self.row = int(self.img.get_height() / self.dh)
         self.col = int(self.img.get_width() / self.dw)
         self.current_frame = self.frame_range[0]  # 当前帧
-        self.frame_count = int(self.speed / (1000 / fps))  # 需要等待几次主循环才切换1帧
+        self.frame_count = int(self.speed / (1000 / fps))  # 需要等待几次逻辑更新才切换1帧
         self.current_count = self.frame_range[0] * self.frame_count  # 当前计数
 
         if self.frame_count < 1:
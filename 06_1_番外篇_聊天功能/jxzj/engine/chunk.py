@@ -0,0 +1,146 @@
+"""
+分块地图
+    大地图按chunk_size*chunk_size像素切成很多小块，只加载视野附近的小块，不用一次性加载整张几百MB的图片
+    目录结构：
+        world.json      {"width": 地图宽度(像素), "height": 地图高度(像素), "chunk_size": 块大小(像素)}
+        walk.bmap       可行走区域（二进制格式，mmap映射，由操作系统按需换入换出）
+        bottom/x_y.png  下层图片的第(x,y)块
+        top/x_y.png     上层图片的第(x,y)块，完全透明的块不保存
+    切分工具：python -m engine.chunk 0.png 0_top.png 0.map 输出目录 [块大小]
+"""
+import json
+import os
+import queue
+import sys
+import traceback
+from collections import OrderedDict
+from threading import Thread
+
+import pygame
+
+from engine.common import Array2D
+from engine.map_file import is_binary, open_walk_map, save_walk_map
+
+WORLD_FILE = 'world.json'
+WALK_FILE = 'walk.bmap'
+
+
+class ChunkLoader:
+    """
+    分块加载器
+        1.get()取不到的块会交给后台线程加载，本帧先返回None
+        2.后台线程加载完成后，在主线程调用update()时放入缓存，update()返回这次放入的块，用来重绘这些块所在的区域
+        3.缓存按LRU淘汰，最多保留capacity块
+    """
+
+    def __init__(self, load, prepare=None, capacity=64):
+        """
+        :param load: 加载函数 load(key)，在后台线程中执行
+        :param prepare: 准备函数 prepare(value)，在主线程中执行（比如surface.convert_alpha()只能在主线程调用）
+        :param capacity: 缓存的最大块数
+        """
+        self.load = load
+        self.prepare = prepare
+        self.capacity = capacity
+        self.cache = OrderedDict()  # 已加载的块，最近使用的在最后
+        self.pending = set()  # 正在加载的块
+        self.requests = queue.LifoQueue()  # 加载请求，后请求的先加载（视野已经移走的旧请求往后放）
+        self.results = queue.SimpleQueue()  # 加载结果
+        Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        while True:
+            key = self.requests.get()
+            try:
+                value = self.load(key)
+            except Exception:
+                traceback.print_exc()
+                value = None
+            self.results.put((key, value))
+
+    def request(self, key):
+        """
+        请求加载一块（已经加载或正在加载的不会重复加载）
+        """
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return
+        if key not in self.pending:
+            self.pending.add(key)
+            self.requests.put(key)
+
+    def get(self, key):
+        """
+        取得一块，还没加载好就返回None
+        """
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        self.request(key)
+        return None
+
+    def update(self):
+        """
+        把后台加载好的块放入缓存，并淘汰最久没用的块（需要每帧在主线程调用）
+        :return: 这次放入缓存的块
+        """
+        loaded = []
+        while True:
+            try:
+                key, value = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(key)
+            if self.prepare and value is not None:
+                value = self.prepare(value)
+            self.cache[key] = value
+            loaded.append(key)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+        return loaded
+
+
+def split_world(bottom_path, top_path, walk_path, out_dir, chunk_size=512):
+    """
+    把一张完整的地图切分成分块地图
+    :param bottom_path: 下层图片
+    :param top_path: 上层图片
+    :param walk_path: 可行走区域文件（.map或.bmap）
+    :param out_dir: 输出目录
+    :param chunk_size: 块大小（像素）
+    """
+    bottom = pygame.image.load(bottom_path)
+    top = pygame.image.load(top_path)
+    width, height = bottom.get_size()
+    os.makedirs(os.path.join(out_dir, 'bottom'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'top'), exist_ok=True)
+
+    for cx in range((width + chunk_size - 1) // chunk_size):
+        for cy in range((height + chunk_size - 1) // chunk_size):
+            rect = pygame.Rect(cx * chunk_size, cy * chunk_size, chunk_size, chunk_size).clip(bottom.get_rect())
+            name = '%d_%d.png' % (cx, cy)
+            pygame.image.save(bottom.subsurface(rect), os.path.join(out_dir, 'bottom', name))
+            sub = top.subsurface(rect.clip(top.get_rect()))
+            if pygame.mask.from_surface(sub, 0).count():
+                pygame.image.save(sub, os.path.join(out_dir, 'top', name))
+
+    # 可行走区域与GameMap一样按32像素一格划分
+    w = int(width / 32) + 1
+    h = int(height / 32) + 1
+    walk = Array2D(w, h)
+    if is_binary(walk_path):
+        walk.attach(open_walk_map(walk_path)[2])
+    else:
+        with open(walk_path, 'rb') as file:
+            walk.load_text(file.read())
+    save_walk_map(os.path.join(out_dir, WALK_FILE), walk)
+
+    with open(os.path.join(out_dir, WORLD_FILE), 'w') as file:
+        json.dump({'width': width, 'height': height, 'chunk_size': chunk_size}, file)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (5, 6):
+        print('用法：python -m engine.chunk 下层图片 上层图片 可行走区域文件 输出目录 [块大小]')
+        sys.exit(1)
+    split_world(*sys.argv[1:5], *[int(v) for v in sys.argv[5:]])
@@ -0,0 +1,97 @@
+"""
+网络数据包的分帧
+    TCP是字节流，一次recv可能收到半个包，也可能收到好几个包，所以需要把数据缓存起来，凑够一个完整的包再处理
+    帧格式：4字节大端无符号整数表示包体长度，后面跟着包体
+    兼容模式：包体后面跟着分隔符"|#|"（旧版本的格式，包体内不能出现分隔符）
+服务端和客户端共用这个模块
+"""
+import struct
+
+DELIMITER = b'|#|'
+LENGTH = struct.Struct('>I')
+MAX_FRAME = 1024 * 1024  # 单个包的最大长度
+
+
+class FrameError(Exception):
+    """
+    数据包格式错误（比如超过了最大长度），遇到这个错误应该断开连接
+    """
+
+
+def frame(payload, delimiter=False):
+    """
+    给包体加上帧头（或分隔符）
+    :param payload: bytes类型的包体
+    :param delimiter: 是否使用兼容模式
+    """
+    if delimiter:
+        return payload + DELIMITER
+    return LENGTH.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    """
+    分帧解码器
+        decoder.feed(data)
+        for pck in decoder:
+            ...
+    迭代得到的是接收缓冲区的memoryview切片（不复制数据），只在本次循环中有效，需要保存的话请自行复制
+    """
+
+    def __init__(self, delimiter=None, max_frame=MAX_FRAME):
+        """
+        :param delimiter: 是否使用兼容模式，None表示根据收到的第一个字节自动判断（旧格式的json包以"{"开头）
+        :param max_frame: 单个包的最大长度
+        """
+        self.delimiter = delimiter
+        self.max_frame = max_frame
+        self.buffer = bytearray()  # 接收缓冲区
+        self.start = 0  # 缓冲区中还没处理的数据的起始位置
+
+    def feed(self, data):
+        """
+        放入收到的数据
+        """
+        if self.delimiter is None and data:
+            self.delimiter = data[:1] == b'{'
+        self.buffer += data
+
+    def __iter__(self):
+        view = memoryview(self.buffer)
+        pck = None
+        try:
+            while True:
+                pck = self.next_frame(view)
+                if pck is None:
+                    break
+                yield pck
+                pck.release()
+        finally:
+            if pck is not None:
+                pck.release()
+            view.release()
+            # 删除已经处理过的数据（必须在所有memoryview释放之后）
+            del self.buffer[:self.start]
+            self.start = 0
+
+    def next_frame(self, view):
+        start = self.start
+        if self.delimiter:
+            end = self.buffer.find(DELIMITER, start)
+            if end == -1:
+                if len(self.buffer) - start > self.max_frame:
+                    raise FrameError('数据包太长')
+                return None
+            self.start = end + len(DELIMITER)
+            return view[start:end]
+
+        if len(self.buffer) - start < LENGTH.size:
+            return None
+        length, = LENGTH.unpack_from(self.buffer, start)
+        if length > self.max_frame:
+            raise FrameError('数据包太长：%d' % length)
+        start += LENGTH.size
+        if len(self.buffer) - start < length:
+            return None
+        self.start = start + length
+        return view[start:self.start]
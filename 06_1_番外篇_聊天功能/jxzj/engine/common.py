@@ -1,3 +1,6 @@
+from array import array
+
+
 class Array2D:
     """
         说明：
@@ -5,13 +8,18 @@ class Array2D:
             2.成员变量w和h是二维数组的宽和高
             3.使用：‘对象[x][y]’可以直接取到相应的值
             4.数组的默认值都是0
+            5.数据按列存放在一块连续的内存中（下标为x*h+y），‘对象[x]’是第x列的memoryview，不会复制数据
+            6.typecode与array模块相同，默认'B'即每个格子1字节（0~255）
     """
+    DIGITS = bytes.maketrans(b'0123456789', bytes(range(10)))
 
-    def __init__(self, w, h, default=0):
+    def __init__(self, w, h, default=0, typecode='B'):
         self.w = w
         self.h = h
-        self.data = []
-        self.data = [[default for y in range(h)] for x in range(w)]
+        self.typecode = typecode
+        self.buffer = array(typecode, [default]) * (w * h)
+        self.view = memoryview(self.buffer)
+        self.data = [self.view[x * h:(x + 1) * h] for x in range(w)]
 
     def debug_show(self):
         for y in range(self.h):
@@ -19,5 +27,34 @@ class Array2D:
                 print(self.data[x][y], end=' ')
             print("")
 
+    show_array2d = debug_show
+
+    def attach(self, buffer):
+        """
+        改为使用外部的内存（比如mmap映射的文件），数据不会被复制
+        :param buffer: 支持缓冲区协议的对象，元素类型要与typecode一致
+        """
+        view = memoryview(buffer)
+        if view.format != self.typecode or len(view) != self.w * self.h:
+            raise ValueError('数据与数组的大小或类型不一致')
+        self.buffer = buffer
+        self.view = view
+        self.data = [view[x * self.h:(x + 1) * self.h] for x in range(self.w)]
+
+    def load_text(self, raw):
+        """
+        从文本中读取数据，文本中每个值之间用空白隔开，按列的顺序排列（先x后y）
+        :param raw: bytes类型的文本
+        """
+        digits = raw.translate(None, b' \t\r\n')
+        if self.typecode == 'B' and len(digits) == self.w * self.h and digits.isdigit():
+            # 每个值都是一位数字，整块转换，不用逐个int()
+            self.view[:] = digits.translate(self.DIGITS)
+            return
+        values = raw.split()
+        if len(values) < self.w * self.h:
+            raise ValueError('数据数量不足：需要%d个，实际%d个' % (self.w * self.h, len(values)))
+        self.view[:] = array(self.typecode, map(int, values[:self.w * self.h]))
+
     def __getitem__(self, item):
         return self.data[item]
@@ -150,6 +150,18 @@ class TextBox:
                            (0, 0, self.width, self.height)
                            )
 
+    def rect(self):
+        """
+        文本框绘制的范围（包括上方的联想词）
+        """
+        return pygame.Rect(self.x, self.y - 30, self.width, self.height + 30)
+
+    def draw_state(self):
+        """
+        影响绘制结果的状态，没有变化就不需要重绘
+        """
+        return self.text, self.state, tuple(self.word_list)
+
     def key_down(self, event):
         if not self.focus:
             return
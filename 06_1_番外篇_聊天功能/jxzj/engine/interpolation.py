@@ -0,0 +1,125 @@
+"""
+其他玩家的插值
+    服务端发来的每个位置都带有服务端时间，存进缓冲区，绘制时取"服务端当前时间 - 插值延迟"那一刻的位置，
+    在前后两个位置之间插值，所以包晚到一点或者几个包一起到，移动也是平滑的
+    缓冲区里没有更新的位置时（包晚到太久），沿着最后的速度外推一小段，超过外推上限后退回到最后的位置
+    已经知道会停下的位置（比如路径的终点）不外推
+不依赖pygame
+"""
+import time
+from collections import deque
+
+
+class ServerClock:
+    """
+    估算服务端当前时间
+        本地时间 - 服务端时间 = 时钟偏差 + 网络延迟，网络延迟最小的包最接近真实的时钟偏差，所以取最小值
+        偏大的值也慢慢跟过去，应对时钟漂移和路由变化
+    """
+
+    def __init__(self, drift=0.01):
+        """
+        :param drift: 每收到一个包，时钟偏差向偏大的值靠近的比例
+        """
+        self.drift = drift
+        self.offset = None  # 本地时间 - 服务端时间（秒）
+
+    def update(self, server_time, local_time=None):
+        """
+        收到了带服务端时间的包
+        :param server_time: 服务端时间（秒）
+        :param local_time: 收到包时的本地时间，默认是现在
+        """
+        if local_time is None:
+            local_time = time.perf_counter()
+        offset = local_time - server_time
+        if self.offset is None or offset < self.offset:
+            self.offset = offset
+        else:
+            self.offset += (offset - self.offset) * self.drift
+
+    def now(self, local_time=None):
+        """
+        :return: 估算的服务端当前时间（秒），还没收到过带时间的包时返回None
+        """
+        if self.offset is None:
+            return None
+        if local_time is None:
+            local_time = time.perf_counter()
+        return local_time - self.offset
+
+
+class InterpolationBuffer:
+    """
+    按服务端时间排列的位置缓冲区
+    """
+
+    def __init__(self, max_extrapolation=0.1, max_gap=0.3):
+        """
+        :param max_extrapolation: 最多外推多长时间（秒）
+        :param max_gap: 两个位置之间最长的移动时间（秒），间隔更长说明中间停下来过
+        """
+        self.max_extrapolation = max_extrapolation
+        self.max_gap = max_gap
+        # (服务端时间, x, y)，不限制数量：一次收到的路径全都要保留，用过的位置在sample()中删除
+        self.samples = deque()
+        self.stopped = False  # 最后一个位置是不是停下的位置
+        self.last_velocity = None  # 最近走完的一段的速度，用于外推
+        self.render_time = None  # 上次绘制的时间，这之前的位置已经画出来了，不能再改
+
+    def push(self, server_time, x, y, stop=False, continuous=False):
+        """
+        添加一个位置，比它晚的位置（比如之前收到的路径中还没走的部分）都作废
+        :param stop: 会停在这个位置，用完后不外推
+        :param continuous: 从上一个位置一直匀速走过来的（比如同一条路径上的拐点），中间没有停下
+        """
+        self.stopped = stop
+        while self.samples and self.samples[-1][0] >= server_time:
+            self.samples.pop()
+        if self.samples and not continuous:
+            last_time, last_x, last_y = self.samples[-1]
+            # 停了一段时间才开始走，不能从上次的位置一直慢慢挪过来，也不能从已经画过的时间开始走（会跳一下）
+            hold = server_time - self.max_gap
+            if self.render_time is not None:
+                hold = max(hold, self.render_time)
+            if last_time < hold < server_time:
+                self.samples.append((hold, last_x, last_y))
+        self.samples.append((server_time, x, y))
+
+    def sample(self, render_time):
+        """
+        :param render_time: 要绘制的服务端时间
+        :return: 这个时间的位置(x, y)，缓冲区为空时返回None
+        """
+        samples = self.samples
+        if not samples:
+            return None
+        self.render_time = render_time
+        # 已经用不到的位置删掉（保留render_time之前的最后一个）
+        while len(samples) > 1 and samples[1][0] <= render_time:
+            (t0, x0, y0), (t1, x1, y1) = samples[0], samples[1]
+            self.last_velocity = ((x1 - x0) / (t1 - t0), (y1 - y0) / (t1 - t0))
+            samples.popleft()
+
+        t0, x0, y0 = samples[0]
+        if render_time <= t0:
+            return x0, y0
+        if len(samples) > 1:
+            t1, x1, y1 = samples[1]
+            k = (render_time - t0) / (t1 - t0)
+            return x0 + (x1 - x0) * k, y0 + (y1 - y0) * k
+        return self.extrapolate(render_time)
+
+    def extrapolate(self, render_time):
+        """
+        缓冲区里的位置都用完了，沿着最后的速度外推（只剩一个位置时不动）
+        超过外推上限后按同样的时间退回最后的位置，如果其实已经停下了，也不会停在错误的地方
+        """
+        t1, x1, y1 = self.samples[-1]
+        if self.last_velocity is None or self.stopped:
+            return x1, y1
+        vx, vy = self.last_velocity
+        elapsed = render_time - t1
+        if elapsed > self.max_extrapolation:
+            elapsed = max(0, 2 * self.max_extrapolation - elapsed)
+        return x1 + vx * elapsed, y1 + vy * elapsed
@@ -0,0 +1,69 @@
+"""
+二进制可行走区域文件（.bmap）
+    文件头：魔数b'JXMP'、版本号、保留字段、宽w、高h（小端，共16字节）
+    数据：w*h个字节，每个格子1字节，和.map文本一样按列存放（先x后y）
+读取时使用mmap映射文件，多个进程打开同一张地图共享同一份物理内存，不需要解析
+转换工具：python -m engine.map_file 0.map 0.bmap 40 22
+"""
+import mmap
+import struct
+import sys
+
+from engine.common import Array2D
+
+MAGIC = b'JXMP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII')
+
+
+def is_binary(path):
+    """
+    文件是不是二进制格式
+    """
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def open_walk_map(path):
+    """
+    映射二进制地图文件
+    :return: (w, h, memoryview) memoryview为地图数据，写入时只修改本进程的副本（写时复制），不会改到文件
+    """
+    with open(path, 'rb') as file:
+        mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    if len(mm) < HEADER.size:
+        raise ValueError('地图文件不完整：' + path)
+    magic, version, _, w, h = HEADER.unpack_from(mm)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('不支持的地图文件：' + path)
+    if len(mm) < HEADER.size + w * h:
+        raise ValueError('地图文件不完整：' + path)
+    return w, h, memoryview(mm)[HEADER.size:HEADER.size + w * h]
+
+
+def save_walk_map(path, map2d):
+    """
+    把Array2D保存为二进制地图文件
+    """
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, map2d.w, map2d.h))
+        file.write(bytes(map2d.view))
+
+
+def convert(src, dst, w, h):
+    """
+    把.map文本文件转换成二进制文件
+    :param w: 地图宽度（格子数）
+    :param h: 地图高度（格子数）
+    """
+    map2d = Array2D(w, h)
+    with open(src, 'rb') as file:
+        map2d.load_text(file.read())
+    save_walk_map(dst, map2d)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 5:
+        print('用法：python -m engine.map_file 源文件.map 目标文件.bmap 宽 高')
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
@@ -0,0 +1,204 @@
+"""
+协议包的编码、解码
+    JSON格式：包体就是json字符串，以"{"开头
+    二进制格式：包体第一个字节是协议编号，后面按MESSAGES中定义的字段依次排列（小端）
+        整数用struct格式字符（'h'、'H'等），UUID为16字节，字符串为2字节长度+utf8
+        字段类型是元组时表示嵌套的字典，是列表时表示字典列表（2字节个数+每个字典）
+        字段类型是Delta时表示只包含部分字段的字典（1字节掩码表示有哪些字段，后面只放这些字段），用于增量同步
+    二进制格式在登录时协商：客户端在cli_login中带上"codec":"binary"，服务端在ser_login中同样回复，之后双方都可以发送二进制包
+    登录等不常用的协议没有定义二进制格式，始终使用JSON
+服务端和客户端共用这个模块
+"""
+import json
+import struct
+
+JSON = 'json'
+BINARY = 'binary'
+
+UUID = 'uuid'
+STR = 'str'
+LENGTH = struct.Struct('<H')
+
+
+class Delta(tuple):
+    """
+    可以缺少字段的字典（最多8个字段），比如只有x变化了就只发送x
+    """
+
+
+PLAYER = (('eid', 'H'), ('uuid', UUID), ('nickname', STR), ('x', 'h'), ('y', 'h'), ('role_id', 'H'))
+
+
+class Message:
+    """
+    一种协议的二进制格式
+    """
+
+    def __init__(self, opcode, name, fields):
+        """
+        :param opcode: 协议编号（1~255，不能是"{"）
+        :param name: 协议名称
+        :param fields: 字段列表 ((字段名, 类型), ...)
+        """
+        self.opcode = opcode
+        self.name = name
+        self.fields = fields
+        # 全是定长字段的话，整个包用一个Struct编码
+        self.struct = None
+        if all(is_fixed(kind) for _, kind in fields):
+            self.struct = struct.Struct('<B' + ''.join(fixed_format(kind) for _, kind in fields))
+
+    def encode(self, py_obj):
+        if self.struct:
+            return self.struct.pack(self.opcode, *flatten(self.fields, py_obj))
+        buf = bytearray((self.opcode,))
+        write_fields(buf, self.fields, py_obj)
+        return bytes(buf)
+
+    def decode(self, view):
+        if self.struct:
+            values = iter(self.struct.unpack_from(view, 0)[1:])
+            protocol = unflatten(self.fields, values)
+        else:
+            protocol, _ = read_fields(view, 1, self.fields)
+        protocol['protocol'] = self.name
+        return protocol
+
+
+def is_fixed(kind):
+    if isinstance(kind, Delta):
+        return False
+    if isinstance(kind, tuple):
+        return all(is_fixed(k) for _, k in kind)
+    return kind == UUID or (isinstance(kind, str) and kind != STR)
+
+
+def fixed_format(kind):
+    if isinstance(kind, tuple):
+        return ''.join(fixed_format(k) for _, k in kind)
+    return '16s' if kind == UUID else kind
+
+
+def flatten(fields, py_obj):
+    values = []
+    for name, kind in fields:
+        value = py_obj[name]
+        if isinstance(kind, tuple):
+            values += flatten(kind, value)
+        else:
+            values.append(bytes.fromhex(value) if kind == UUID else value)
+    return values
+
+
+def unflatten(fields, values):
+    result = {}
+    for name, kind in fields:
+        if isinstance(kind, tuple):
+            result[name] = unflatten(kind, values)
+        else:
+            value = next(values)
+            result[name] = value.hex() if kind == UUID else value
+    return result
+
+
+def write_fields(buf, fields, py_obj):
+    for name, kind in fields:
+        value = py_obj[name]
+        if isinstance(kind, Delta):
+            fields = [field for field in kind if field[0] in value]
+            buf.append(sum(1 << index for index, field in enumerate(kind) if field[0] in value))
+            write_fields(buf, fields, value)
+        elif isinstance(kind, tuple):
+            write_fields(buf, kind, value)
+        elif isinstance(kind, list):
+            buf += LENGTH.pack(len(value))
+            for item in value:
+                write_fields(buf, kind[0], item)
+        elif kind == STR:
+            data = value.encode()
+            buf += LENGTH.pack(len(data))
+            buf += data
+        elif kind == UUID:
+            buf += bytes.fromhex(value)
+        else:
+            buf += struct.pack('<' + kind, value)
+
+
+def read_fields(view, offset, fields):
+    result = {}
+    for name, kind in fields:
+        if isinstance(kind, Delta):
+            mask = view[offset]
+            fields = [field for index, field in enumerate(kind) if mask & (1 << index)]
+            result[name], offset = read_fields(view, offset + 1, fields)
+        elif isinstance(kind, tuple):
+            result[name], offset = read_fields(view, offset, kind)
+        elif isinstance(kind, list):
+            count, = LENGTH.unpack_from(view, offset)
+            offset += LENGTH.size
+            items = []
+            for _ in range(count):
+                item, offset = read_fields(view, offset, kind[0])
+                items.append(item)
+            result[name] = items
+        elif kind == STR:
+            length, = LENGTH.unpack_from(view, offset)
+            offset += LENGTH.size
+            result[name] = str(view[offset:offset + length], 'utf8')
+            offset += length
+        elif kind == UUID:
+            result[name] = view[offset:offset + 16].hex()
+            offset += 16
+        else:
+            result[name], = struct.unpack_from('<' + kind, view, offset)
+            offset += struct.calcsize(kind)
+    return result, offset
+
+
+MESSAGES = [
+    # 客户端发送
+    Message(1, 'cli_move', (('x', 'h'), ('y', 'h'))),
+    Message(2, 'cli_chat', (('text', STR),)),
+    Message(3, 'cli_goto', (('sx', 'h'), ('sy', 'h'), ('x', 'h'), ('y', 'h'))),
+    # 服务端发送
+    Message(129, 'ser_online', (('player_data', PLAYER),)),
+    Message(130, 'ser_offline', (('eid', 'H'),)),
+    Message(131, 'ser_enter_view', (('player_data', PLAYER),)),
+    Message(132, 'ser_leave_view', (('eid', 'H'),)),
+    Message(133, 'ser_player_list', (('player_list', [PLAYER]),)),
+    Message(134, 'ser_chat', (('text', STR), ('nickname', STR))),
+    Message(135, 'ser_snapshot', (('time', 'I'),
+                                  ('players', [(('eid', 'H'), ('state', Delta((('x', 'h'), ('y', 'h')))))]))),
+    Message(136, 'ser_move_path', (('time', 'I'), ('step_time', 'H'), ('eid', 'H'), ('sx', 'h'), ('sy', 'h'),
+                                   ('path', [(('x', 'h'), ('y', 'h'))]))),
+]
+BY_NAME = {message.name: message for message in MESSAGES}
+BY_OPCODE = {message.opcode: message for message in MESSAGES}
+
+
+def encode(py_obj, codec=JSON):
+    """
+    编码协议包
+    :param py_obj: 协议字典
+    :param codec: JSON或BINARY，没有定义二进制格式的协议始终使用JSON
+    :return: bytes类型的包体
+    """
+    if codec == BINARY:
+        message = BY_NAME.get(py_obj['protocol'])
+        if message:
+            return message.encode(py_obj)
+    return json.dumps(py_obj, ensure_ascii=False).encode()
+
+
+def decode(pck):
+    """
+    解码协议包，根据第一个字节判断是JSON还是二进制格式
+    :param pck: bytes或memoryview类型的包体
+    :return: 协议字典
+    """
+    if pck[0] == ord('{'):
+        return json.loads(str(pck, 'utf8'))
+    message = BY_OPCODE.get(pck[0])
+    if message is None:
+        raise ValueError('未知的协议编号：%d' % pck[0])
+    return message.decode(pck)
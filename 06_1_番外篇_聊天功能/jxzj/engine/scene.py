@@ -1,3 +1,5 @@
+import pygame
+
 from engine.gui import Button
 
 
@@ -17,9 +19,11 @@ class Scene:
         """
         raise NotImplementedError
 
-    def render(self):
+    def render(self, alpha=1):
         """
         渲染
+        :param alpha: 距离上次逻辑更新过去了多少个逻辑更新间隔（0~1），用于在两次逻辑更新之间插值
+        :return: 需要刷新到屏幕上的矩形列表，返回None表示刷新整个屏幕
         """
         raise NotImplementedError
 
@@ -63,3 +67,60 @@ class SceneManager:
         for scene in self.scenes:
             if scene.scene_id == scene_id:
                 return scene
+
+
+class DirtyTracker:
+    """
+    脏矩形记录
+        1.每帧调用track()记录每个对象的矩形和绘制状态
+        2.collect()返回和上一帧相比需要重绘的矩形（变化了的对象的新旧矩形、消失了的对象的旧矩形）
+        3.不属于某个对象的变化（比如分块地图刚加载完的块）用mark()直接标记
+    """
+
+    def __init__(self, limit=8):
+        """
+        :param limit: 矩形数量超过这个值就合并成一个大矩形
+        """
+        self.limit = limit
+        self.last = {}  # 上一帧 对象->(矩形, 状态)
+        self.current = {}  # 这一帧 对象->(矩形, 状态)
+        self.marked = []  # 这一帧直接标记的矩形
+
+    def track(self, key, rect, state=None):
+        self.current[key] = (pygame.Rect(rect), state)
+
+    def mark(self, rect):
+        self.marked.append(pygame.Rect(rect))
+
+    def collect(self):
+        dirty = self.marked
+        self.marked = []
+        for key, (rect, state) in self.current.items():
+            old = self.last.get(key)
+            if old is None:
+                dirty.append(rect)
+            elif old != (rect, state):
+                dirty.append(rect)
+                dirty.append(old[0])
+        for key, (rect, _) in self.last.items():
+            if key not in self.current:
+                dirty.append(rect)
+        self.last = self.current
+        self.current = {}
+        return self.merge(dirty)
+
+    def merge(self, rects):
+        """
+        合并相交的矩形
+        """
+        merged = []
+        for rect in rects:
+            rect = rect.copy()
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect.union_ip(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        if len(merged) > self.limit:
+            return [merged[0].unionall(merged[1:])]
+        return merged
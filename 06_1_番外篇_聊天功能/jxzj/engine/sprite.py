@@ -1,3 +1,5 @@
+from collections import OrderedDict
+
 import pygame
 
 
@@ -81,11 +83,70 @@ class Sprite:
         target.blit(surface, (x, y))
 
 
+class TextCache:
+    """
+    文字surface缓存
+        1.以(文字, 字体, 颜色, 边框颜色)为键缓存渲染好的surface，带边框的文字预先合成为一张surface
+        2.按LRU淘汰，缓存的surface总字节数不超过max_bytes
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0  # 当前缓存的字节数
+        self.cache = OrderedDict()
+
+    @staticmethod
+    def size_of(surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def get(self, text, font, rgb, outter_rgb=None):
+        """
+        取得文字surface，带边框的surface比文字本身上下左右各大1像素
+        """
+        key = (text, font, tuple(rgb), tuple(outter_rgb) if outter_rgb else None)
+        surface = self.cache.get(key)
+        if surface is not None:
+            self.cache.move_to_end(key)
+            return surface
+
+        surface = self.render(text, font, rgb, outter_rgb)
+        self.cache[key] = surface
+        self.bytes += self.size_of(surface)
+        while self.bytes > self.max_bytes and len(self.cache) > 1:
+            _, old = self.cache.popitem(last=False)
+            self.bytes -= self.size_of(old)
+        return surface
+
+    @staticmethod
+    def render(text, font, rgb, outter_rgb=None):
+        sur_inner = font.render(text, True, rgb)
+        if not outter_rgb:
+            return sur_inner
+        sur_outter = font.render(text, True, outter_rgb)
+        w, h = sur_inner.get_size()
+        surface = pygame.Surface((w + 2, h + 2), pygame.SRCALPHA)
+        surface.blit(sur_outter, (2, 1))
+        surface.blit(sur_outter, (0, 1))
+        surface.blit(sur_outter, (1, 2))
+        surface.blit(sur_outter, (1, 0))
+        surface.blit(sur_inner, (1, 1))
+        if pygame.display.get_surface():
+            surface = surface.convert_alpha()
+        return surface
+
+    def clear(self):
+        self.cache.clear()
+        self.bytes = 0
+
+
+text_cache = TextCache()  # draw_*text默认使用的文字缓存
+
+
 def draw_text(dest, x, y, text, font, rgb):
     """
     绘制文字（取中心点绘制）
     """
-    surface = font.render(text, True, rgb)
+    surface = text_cache.get(text, font, rgb)
     w = surface.get_width()
     Sprite.blit(dest, surface, x - int(w / 2), y)
 
@@ -94,7 +155,7 @@ def draw_src_text(dest, x, y, text, font, rgb):
     """
     绘制文字
     """
-    surface = font.render(text, True, rgb)
+    surface = text_cache.get(text, font, rgb)
     Sprite.blit(dest, surface, x, y)
 
 
@@ -102,27 +163,17 @@ def draw_outline_text(dest, x, y, text, font, inner_rgb, outter_rgb):
     """
     绘制带边框的文字
     """
-    sur_inner = font.render(text, True, inner_rgb)
-    sur_outter = font.render(text, True, outter_rgb)
-    w = sur_inner.get_width()
-    Sprite.blit(dest, sur_outter, x - int(w / 2) + 1, y)
-    Sprite.blit(dest, sur_outter, x - int(w / 2) - 1, y)
-    Sprite.blit(dest, sur_outter, x - int(w / 2), y + 1)
-    Sprite.blit(dest, sur_outter, x - int(w / 2), y - 1)
-    Sprite.blit(dest, sur_inner, x - int(w / 2), y)
+    surface = text_cache.get(text, font, inner_rgb, outter_rgb)
+    w = surface.get_width() - 2
+    Sprite.blit(dest, surface, x - int(w / 2) - 1, y - 1)
 
 
 def draw_src_outline_text(dest, x, y, text, font, inner_rgb, outter_rgb):
     """
     绘制带边框的文字
     """
-    sur_inner = font.render(text, True, inner_rgb)
-    sur_outter = font.render(text, True, outter_rgb)
-    Sprite.blit(dest, sur_outter, x + 1, y)
-    Sprite.blit(dest, sur_outter, x - 1, y)
-    Sprite.blit(dest, sur_outter, x, y + 1)
-    Sprite.blit(dest, sur_outter, x, y - 1)
-    Sprite.blit(dest, sur_inner, x, y)
+    surface = text_cache.get(text, font, inner_rgb, outter_rgb)
+    Sprite.blit(dest, surface, x - 1, y - 1)
 
 
 def draw_rect_text(dest, color, text, font, x, y, width):
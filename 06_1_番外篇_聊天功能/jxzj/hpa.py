@@ -0,0 +1,426 @@
+import heapq
+
+from astar import Point
+
+
+class ClusterGraph:
+    """
+    分层寻路（HPA*）的抽象图
+        1.把可行走区域按size*size划分成若干个簇（cluster）
+        2.相邻两个簇的边界上，连续的可通行格子为一个入口，入口两侧的格子作为抽象图的节点
+        3.同一个簇内的节点之间的距离用簇内广度优先搜索算出来，第一次用到这个簇时才算，大地图打开时不用等所有簇算完
+        4.寻路时先在抽象图上寻路，再把每一段在簇内展开成逐格的路径
+        5.抽象图上的路径都要经过入口，会绕一点路，展开后再分段重新寻路把路径拉直（refine）
+          起点终点在同一个或相邻的簇内时，直接在这几个簇的范围内寻路，不经过抽象图
+    与astar.py一样是四方向寻路，每格花费10
+    """
+
+    REFINE_WINDOW = 20  # 优化路径时每次重新寻路的一段的步数
+    REFINE_MARGIN = 2  # 重新寻路时在这一段的外接矩形四周多留的格子数，可以绕开小的障碍
+
+    def __init__(self, map2d, size=10, passTag=0):
+        """
+        :param map2d: Array2D类型的寻路数组
+        :param size: 簇的边长（格子数）
+        :param passTag: int类型的可行走标记（若地图数据!=passTag即为障碍）
+        """
+        self.map2d = map2d
+        self.size = size
+        self.passTag = passTag
+        self.cw = (map2d.w + size - 1) // size  # 横向簇数
+        self.ch = (map2d.h + size - 1) // size  # 纵向簇数
+        self.borders = {}  # 边界 -> [(簇内节点, 相邻簇内节点), ...]
+        self.inter = {}  # 节点 -> {相邻簇中的节点}
+        self.intra = {}  # 簇 -> {节点: {同簇节点: 距离}}，只有用到过的簇
+        self.paths = {}  # 簇 -> {(节点a, 节点b): 簇内路径}，展开路径时的缓存
+        self.near = {}  # 簇 -> 簇内各格子可以走到的相邻格子，都用簇内下标(x-x0)*簇高+(y-y0)表示
+        self.shapes = {}  # (簇宽, 簇高) -> 各格子在簇内的相邻格子，大小相同的簇共用
+        self.build()
+
+    def cluster_of(self, x, y):
+        return x // self.size, y // self.size
+
+    def cluster_rect(self, cluster):
+        """
+        簇的范围 (x0, y0, x1, y1)，x1、y1不包含
+        """
+        x0 = cluster[0] * self.size
+        y0 = cluster[1] * self.size
+        return x0, y0, min(x0 + self.size, self.map2d.w), min(y0 + self.size, self.map2d.h)
+
+    def cluster_borders(self, cluster):
+        """
+        簇四周的边界，('v', cx, cy)是(cx,cy)与(cx+1,cy)之间的边界，('h', cx, cy)是(cx,cy)与(cx,cy+1)之间的边界
+        """
+        cx, cy = cluster
+        borders = []
+        if cx > 0:
+            borders.append(('v', cx - 1, cy))
+        if cx < self.cw - 1:
+            borders.append(('v', cx, cy))
+        if cy > 0:
+            borders.append(('h', cx, cy - 1))
+        if cy < self.ch - 1:
+            borders.append(('h', cx, cy))
+        return borders
+
+    def build(self):
+        """
+        清空抽象图，各个簇在寻路第一次用到时才构建（见cluster_edges）
+        """
+        self.borders.clear()
+        self.inter.clear()
+        self.intra.clear()
+        self.paths.clear()
+        self.near.clear()
+
+    def cluster_edges(self, cluster):
+        """
+        簇内各节点之间的距离，簇还没构建就先扫描它四周的边界再构建
+        节点的inter（通往相邻簇的边）也要等所在的簇构建后才是完整的
+        """
+        edges = self.intra.get(cluster)
+        if edges is None:
+            for border in self.cluster_borders(cluster):
+                if border not in self.borders:
+                    self.scan_border(border)
+            self.build_cluster(cluster)
+            edges = self.intra[cluster]
+        return edges
+
+    def update_cell(self, x, y):
+        """
+        某个格子的可行走状态改变了，受影响的簇丢弃后等下次用到时重建
+        """
+        cluster = self.cluster_of(x, y)
+        x0, y0, x1, y1 = self.cluster_rect(cluster)
+        dirty = {cluster}
+        for border in self.cluster_borders(cluster):
+            kind, cx, cy = border
+            # 只有格子在这条边界线上，边界上的入口才会变化
+            if kind == 'v' and x != (x1 - 1 if cx == cluster[0] else x0):
+                continue
+            if kind == 'h' and y != (y1 - 1 if cy == cluster[1] else y0):
+                continue
+            # 还没扫描过的边界等用到时再扫描
+            if border in self.borders:
+                self.scan_border(border)
+            dirty.add((cx, cy))
+            dirty.add((cx + 1, cy) if kind == 'v' else (cx, cy + 1))
+        self.near.pop(cluster, None)
+        for c in dirty:
+            self.intra.pop(c, None)
+            self.paths.pop(c, None)
+
+    def walkable(self, x, y):
+        return self.map2d[x][y] == self.passTag
+
+    def scan_border(self, border):
+        """
+        扫描一条边界，找出上面的入口
+        """
+        for a, b in self.borders.pop(border, []):
+            self.inter[a].discard(b)
+            self.inter[b].discard(a)
+            if not self.inter[a]:
+                del self.inter[a]
+            if not self.inter[b]:
+                del self.inter[b]
+
+        kind, cx, cy = border
+        if kind == 'v':
+            x = (cx + 1) * self.size - 1
+            y0, y1 = cy * self.size, min((cy + 1) * self.size, self.map2d.h)
+            cells = [((x, y), (x + 1, y)) for y in range(y0, y1)]
+        else:
+            y = (cy + 1) * self.size - 1
+            x0, x1 = cx * self.size, min((cx + 1) * self.size, self.map2d.w)
+            cells = [((x, y), (x, y + 1)) for x in range(x0, x1)]
+
+        pairs = []
+        run = []
+        for a, b in cells + [(None, None)]:
+            if a is not None and self.walkable(*a) and self.walkable(*b):
+                run.append((a, b))
+                continue
+            if run:
+                # 入口比较短就取中间，比较长就取两端
+                if len(run) < 6:
+                    pairs.append(run[len(run) // 2])
+                else:
+                    pairs.append(run[0])
+                    pairs.append(run[-1])
+                run = []
+
+        self.borders[border] = pairs
+        for a, b in pairs:
+            self.inter.setdefault(a, set()).add(b)
+            self.inter.setdefault(b, set()).add(a)
+
+    def cluster_nodes(self, cluster):
+        """
+        簇内的所有节点
+        """
+        nodes = set()
+        for border in self.cluster_borders(cluster):
+            for a, b in self.borders.get(border, []):
+                nodes.add(a if self.cluster_of(*a) == cluster else b)
+        return nodes
+
+    def build_cluster(self, cluster):
+        """
+        计算簇内各节点之间的距离
+        """
+        nodes = [(node, self.local_index(cluster, node)) for node in self.cluster_nodes(cluster)]
+        edges = {}
+        for node, _ in nodes:
+            dist, _ = self.bfs(node, cluster)
+            edges[node] = {other: dist[i] for other, i in nodes if other != node and dist[i] >= 0}
+        self.intra[cluster] = edges
+        self.paths[cluster] = {}
+
+    def cluster_near(self, cluster):
+        """
+        簇内各格子可以走到的相邻格子（上下左右的顺序），下标见local_index
+        簇内的BFS都用它，不用每次都判断越界和障碍
+        """
+        near = self.near.get(cluster)
+        if near is None:
+            x0, y0, x1, y1 = self.cluster_rect(cluster)
+            map2d = self.map2d
+            passTag = self.passTag
+            walk = [map2d[x][y] == passTag for x in range(x0, x1) for y in range(y0, y1)]
+            near = [[j for j in others if walk[j]] for others in self.cluster_shape(x1 - x0, y1 - y0)]
+            self.near[cluster] = near
+        return near
+
+    def cluster_shape(self, w, h):
+        """
+        w*h的簇内各格子上下左右的相邻格子（不越界的）
+        """
+        shape = self.shapes.get((w, h))
+        if shape is None:
+            n = w * h
+            shape = []
+            for i in range(n):
+                y = i % h
+                # 上下两格不能跨到相邻的列，左右两格越界时下标小于0或大于等于n
+                shape.append(tuple(j for j in (i - 1 if y else -1, i + 1 if y < h - 1 else -1, i - h, i + h)
+                                   if 0 <= j < n))
+            self.shapes[(w, h)] = shape
+        return shape
+
+    def local_index(self, cluster, point):
+        """
+        格子在簇内的下标(x-x0)*簇高+(y-y0)
+        """
+        x0, y0, x1, y1 = self.cluster_rect(cluster)
+        return (point[0] - x0) * (y1 - y0) + point[1] - y0
+
+    def bfs(self, start, cluster, goal=None):
+        """
+        在簇内做广度优先搜索，格子用簇内下标表示，比以(x,y)为键的dict快很多
+        :return: (距离列表, 父节点列表)，下标为簇内下标，走不到的格子距离为-1
+        """
+        near = self.cluster_near(cluster)
+        begin = self.local_index(cluster, start)
+        end = -1 if goal is None else self.local_index(cluster, goal)
+        dist = [-1] * len(near)
+        father = [-1] * len(near)
+        dist[begin] = 0
+        queue = [begin]
+        # 边遍历边往列表后面追加，就是先进先出的队列
+        for current in queue:
+            if current == end:
+                break
+            d = dist[current] + 10
+            for other in near[current]:
+                if dist[other] < 0:
+                    dist[other] = d
+                    father[other] = current
+                    queue.append(other)
+        return dist, father
+
+    def local_path(self, start, end):
+        """
+        簇内两点之间的逐格路径（不包括起点），走不通返回None
+        """
+        cluster = self.cluster_of(*start)
+        edges = self.cluster_edges(cluster)
+        # 只缓存节点之间的路径，临时接入的起点终点不缓存
+        cache = self.paths[cluster] if start in edges and end in edges else {}
+        if (start, end) in cache:
+            return cache[(start, end)]
+        dist, father = self.bfs(start, cluster, end)
+        index = self.local_index(cluster, end)
+        if dist[index] < 0:
+            return None
+        x0, y0, x1, y1 = self.cluster_rect(cluster)
+        h = y1 - y0
+        begin = self.local_index(cluster, start)
+        path = []
+        while index != begin:
+            path.append((x0 + index // h, y0 + index % h))
+            index = father[index]
+        path.reverse()
+        cache[(start, end)] = path
+        return path
+
+    def links(self, point):
+        """
+        临时把一个点接入抽象图：返回它到所在簇各节点的距离
+        """
+        cluster = self.cluster_of(*point)
+        edges = self.cluster_edges(cluster)
+        dist, _ = self.bfs(point, cluster)
+        links = {}
+        for node in edges:
+            d = dist[self.local_index(cluster, node)]
+            if d >= 0 and node != point:
+                links[node] = d
+        return links
+
+    def find_path(self, start, end):
+        """
+        分层寻路
+        :param start: 二元组类型的寻路起点
+        :param end: 二元组类型的寻路终点
+        :return: None或Point列表（路径）
+        """
+        start = tuple(start)
+        end = tuple(end)
+        if start == end or not self.walkable(*end):
+            return None
+
+        # 起点终点在同一个或相邻的簇内，先在这几个簇的范围内直接寻路，相邻的格子不会绕到入口去
+        start_cluster = self.cluster_of(*start)
+        end_cluster = self.cluster_of(*end)
+        if abs(start_cluster[0] - end_cluster[0]) <= 1 and abs(start_cluster[1] - end_cluster[1]) <= 1:
+            a = self.cluster_rect(start_cluster)
+            b = self.cluster_rect(end_cluster)
+            path = self.rect_path(start, end, (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])))
+            if path:
+                return [Point(x, y) for x, y in path]
+
+        start_links = self.links(start)
+        end_links = self.links(end)
+
+        # 在抽象图上做A*
+        open_list = [(0, 0, start)]
+        g = {start: 0}
+        father = {start: None}
+        closed = set()
+        while open_list:
+            _, cost, node = heapq.heappop(open_list)
+            if node in closed or cost != g[node]:
+                continue
+            if node == end:
+                break
+            closed.add(node)
+            if node == start:
+                near = list(start_links.items())
+            else:
+                # 先构建节点所在的簇，节点的inter才是完整的
+                near = list(self.cluster_edges(self.cluster_of(*node)).get(node, {}).items())
+            near += [(other, 10) for other in self.inter.get(node, ())]
+            if node in end_links:
+                near.append((end, end_links[node]))
+            for other, step in near:
+                if other in closed:
+                    continue
+                new_g = cost + step
+                if new_g < g.get(other, new_g + 1):
+                    g[other] = new_g
+                    father[other] = node
+                    h = (abs(end[0] - other[0]) + abs(end[1] - other[1])) * 10
+                    heapq.heappush(open_list, (new_g + h, new_g, other))
+        else:
+            return None
+
+        # 把抽象路径展开成逐格路径
+        nodes = []
+        node = end
+        while node is not None:
+            nodes.append(node)
+            node = father[node]
+        nodes.reverse()
+        path = []
+        for a, b in zip(nodes, nodes[1:]):
+            if self.cluster_of(*a) == self.cluster_of(*b):
+                path += self.local_path(a, b)
+            else:
+                path.append(b)
+        return [Point(x, y) for x, y in self.refine(start, path)]
+
+    def rect_path(self, start, end, rect):
+        """
+        在rect范围内用A*寻找最短的逐格路径（不包括起点），走不通返回None
+        格子用rect内的下标(x-x0)*高+(y-y0)表示
+        """
+        x0, y0, x1, y1 = rect
+        w = x1 - x0
+        h = y1 - y0
+        map2d = self.map2d
+        passTag = self.passTag
+        ex = end[0] - x0
+        ey = end[1] - y0
+        begin = (start[0] - x0) * h + start[1] - y0
+        goal = ex * h + ey
+        g = {begin: 0}
+        father = {}
+        closed = set()
+        # F值相同时先展开g值大的（离终点近的）
+        open_list = [(0, 0, begin)]
+        while open_list:
+            _, _, current = heapq.heappop(open_list)
+            if current == goal:
+                break
+            if current in closed:
+                continue
+            closed.add(current)
+            cost = g[current] + 10
+            x, y = divmod(current, h)
+            for nx, ny in ((x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)):
+                if 0 <= nx < w and 0 <= ny < h:
+                    other = nx * h + ny
+                    if cost < g.get(other, cost + 1) and map2d[x0 + nx][y0 + ny] == passTag:
+                        g[other] = cost
+                        father[other] = current
+                        heapq.heappush(open_list, (cost + (abs(ex - nx) + abs(ey - ny)) * 10, -cost, other))
+        else:
+            return None
+        path = []
+        while goal != begin:
+            path.append((x0 + goal // h, y0 + goal % h))
+            goal = father[goal]
+        path.reverse()
+        return path
+
+    def refine(self, start, path):
+        """
+        优化抽象图展开后的路径：每REFINE_WINDOW步为一段，在这一段的外接矩形（四周多留REFINE_MARGIN格）内重新寻路，
+        更短就替换，相邻的两段重叠一半，拐角处也能拉直
+        :param start: 起点
+        :param path: 逐格路径（二元组列表，不包括起点）
+        :return: 优化后的路径（不包括起点）
+        """
+        path = [start] + path
+        window = self.REFINE_WINDOW
+        margin = self.REFINE_MARGIN
+        i = 0
+        while True:
+            j = min(i + window, len(path) - 1)
+            (ax, ay), (bx, by) = path[i], path[j]
+            # 步数已经等于曼哈顿距离的话，不可能更短了
+            if j - i > abs(ax - bx) + abs(ay - by):
+                xs = [p[0] for p in path[i:j + 1]]
+                ys = [p[1] for p in path[i:j + 1]]
+                rect = (max(min(xs) - margin, 0), max(min(ys) - margin, 0),
+                        min(max(xs) + margin + 1, self.map2d.w), min(max(ys) + margin + 1, self.map2d.h))
+                shorter = self.rect_path(path[i], path[j], rect)
+                if shorter is not None and len(shorter) < j - i:
+                    path[i + 1:j + 1] = shorter
+                    j = i + len(shorter)
+            if j == len(path) - 1:
+                return path[1:]
+            i += window // 2
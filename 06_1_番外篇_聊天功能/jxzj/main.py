@@ -1,5 +1,6 @@
 import sys
 import socket
+import time
 
 import pygame
 
@@ -12,18 +13,27 @@ from net import Client
 
 
 class Game:
-    def __init__(self, title, width, height, fps=60):
+    """
+    游戏主循环
+        逻辑按固定的频率更新（角色行走、动画的速度和帧率无关），绘制的帧率可以高也可以低
+        绘制时在最近两次逻辑更新之间插值，帧率比逻辑更新频率高时移动也是平滑的
+    """
+    MAX_LAG = 0.25  # 卡顿很久（比如拖动窗口）时最多追赶这么长时间的逻辑更新，避免越追越卡
+
+    def __init__(self, title, width, height, fps=60, logic_rate=60):
         """
         :param title: 游戏窗口的标题
         :param width: 游戏窗口的宽度
         :param height: 游戏窗口的高度
-        :param fps: 游戏每秒刷新次数
+        :param fps: 游戏每秒最多刷新次数
+        :param logic_rate: 每秒逻辑更新次数
         """
         self.title = title
         self.width = width
         self.height = height
         self.screen_surf = None
         self.fps = fps
+        self.logic_interval = 1 / logic_rate
         self.__init_pygame()
         self.__init_game()
         self.update()
@@ -53,19 +63,36 @@ class Game:
         g.scene_mgr.add(game_scene)
         # 与服务端建立连接
         s = socket.socket()
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # 每帧的数据已经合并过了，不需要Nagle算法再等待
         s.connect(('47.100.44.206', 8712))  # 与服务器建立连接
         self.client = Client(s, game_scene)
         g.client = self.client  # 把client赋值给全局对象上，以便到处使用
 
     def update(self):
+        lag = 0  # 还没有进行逻辑更新的时间
+        last_time = time.perf_counter()
         while True:
             self.clock.tick(self.fps)
+            now = time.perf_counter()
+            lag += min(now - last_time, self.MAX_LAG)
+            last_time = now
+            # 处理服务端发来的协议
+            self.client.process_events()
             # 输入事件处理
             scene = g.scene_mgr.find_scene_by_id(g.scene_id)
             self.event_handler()
-            scene.logic()
-            scene.render()
-            pygame.display.update()
+            # 按固定的间隔进行逻辑更新，一帧可能更新多次，也可能不更新
+            while lag >= self.logic_interval:
+                scene.logic()
+                lag -= self.logic_interval
+            rects = scene.render(lag / self.logic_interval)
+            # 场景返回了脏矩形就只刷新这些区域
+            if rects is None:
+                pygame.display.update()
+            else:
+                pygame.display.update(rects)
+            # 发送这一帧中产生的协议包
+            self.client.flush()
 
     def event_handler(self):
         x, y = pygame.mouse.get_pos()
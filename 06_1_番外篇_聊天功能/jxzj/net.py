@@ -1,19 +1,31 @@
-import json
+import queue
+import time
 import traceback
 from threading import Thread
 
-from core import Player, CharWalk
+from core import Player, CharWalk, RemotePlayer
+from engine.codec import FrameDecoder, frame
+from engine.interpolation import ServerClock
+from engine.protocol import BINARY, JSON, decode, encode
 from game_global import g
 
 
 class Client:
     """
     客户端与服务端网络交互相关的操作
+        接收线程只负责接收和解码，解码出来的协议放入收件箱（inbox）
+        主线程每帧调用process_events()处理收件箱中的协议，游戏对象只在主线程中修改
     """
 
     def __init__(self, socket, game_scene):
         self.socket = socket  # 客户端socket
         self.game = game_scene  # GameScene对象
+        self.decoder = FrameDecoder(delimiter=False)  # 分帧解码器
+        self.codec = JSON  # 发送的包使用的编码，登录成功后使用服务端确认的编码
+        self.inbox = queue.SimpleQueue()  # 收到的协议，等待主线程处理
+        self.outbox = []  # 要发送的数据，每帧结束时调用flush()一起发送
+        self.states = {}  # 服务端同步过来的其他玩家的状态 实体编号 -> {字段: 值}，ser_snapshot只包含变化了的字段
+        self.clock = ServerClock()  # 估算服务端时间，其他玩家按服务端时间插值
         # 创建一个线程专门处理数据接收
         thread = Thread(target=self.recv_data)
         thread.setDaemon(True)
@@ -29,21 +41,39 @@ class Client:
         """
         处理数据
         """
-        # 将字节流转成字符串
-        pck = bytes.decode()
-        # 切割数据包
-        pck = pck.split('|#|')
-        # 处理每一个协议,最后一个是空字符串，不用处理它
-        for str_protocol in pck[:-1]:
-            protocol = json.loads(str_protocol)
+        self.decoder.feed(bytes)
+        # 处理每一个完整的数据包，不完整的留在缓冲区中等待后面的数据
+        for pck in self.decoder:
+            # 交给主线程处理
+            self.inbox.put(decode(pck))
+
+    def process_events(self, max_events=200, time_budget=0.004):
+        """
+        处理收件箱中的协议（在主线程中每帧调用）
+        网络数据突然变多时，一帧只处理一部分，剩下的留到下一帧，避免卡顿
+        :param max_events: 每帧最多处理的协议数
+        :param time_budget: 每帧最多用于处理协议的时间（秒）
+        :return: 处理的协议数
+        """
+        deadline = time.perf_counter() + time_budget
+        count = 0
+        while count < max_events:
+            try:
+                protocol = self.inbox.get_nowait()
+            except queue.Empty:
+                break
             # 根据协议中的protocol字段，直接调用相应的函数处理
             self.protocol_handler(protocol)
+            count += 1
+            if time.perf_counter() > deadline:
+                break
+        return count
 
     def recv_data(self):
         # 接收数据
         try:
             while True:
-                bytes = self.socket.recv(4096)
+                bytes = self.socket.recv(65536)
                 if len(bytes) == 0:
                     self.socket.close()
                     # TODO:掉线处理
@@ -57,10 +87,20 @@ class Client:
 
     def send(self, py_obj):
         """
-        给服务器发送协议包
+        给服务器发送协议包（先放到outbox中，flush()时才真正发送）
         py_obj:python的字典或者list
         """
-        self.socket.sendall((json.dumps(py_obj, ensure_ascii=False) + '|#|').encode())
+        self.outbox.append(frame(encode(py_obj, self.codec)))
+
+    def flush(self):
+        """
+        把这一帧中要发送的协议包合并成一次发送（在主线程中每帧调用）
+        """
+        if not self.outbox:
+            return
+        data = b''.join(self.outbox)
+        self.outbox.clear()
+        self.socket.sendall(data)
 
     def protocol_handler(self, protocol):
         """
@@ -73,42 +113,78 @@ class Client:
                 print("登录失败：", protocol['msg'])
                 return
             # 登录成功
+            self.codec = protocol.get('codec', JSON)
             # 创建玩家
             self.game.role = Player(self.game.hero, protocol['player_data']['role_id'], CharWalk.DIR_DOWN,
                                     protocol['player_data']['x'], protocol['player_data']['y'],
-                                    name=protocol['player_data']['nickname'], uuid=protocol['player_data']['uuid'])
+                                    name=protocol['player_data']['nickname'], uuid=protocol['player_data']['uuid'],
+                                    eid=protocol['player_data']['eid'])
             # 把玩家存到全局对象中，后面有用
             g.player = self.game.role
             g.scene_id = 2  # 切换场景
         elif protocol['protocol'] == 'ser_player_list':
-            # 玩家列表
-            print(protocol)
+            # 视野内的玩家列表
             for player_data in protocol['player_list']:
-                player = Player(self.game.hero, player_data['role_id'], CharWalk.DIR_DOWN,
-                                player_data['x'], player_data['y'],
-                                name=player_data['nickname'], uuid=player_data['uuid']
-                                )
-                self.game.other_player.append(player)
-        elif protocol['protocol'] == 'ser_move':
-            # 其他玩家移动了
-            for p in self.game.other_player:
-                if p.uuid == protocol['player_data']['uuid']:
-                    p.goto(protocol['player_data']['x'], protocol['player_data']['y'])
-                    break
-        elif protocol['protocol'] == 'ser_online':
-            # 有其他玩家上线
-            player_data = protocol['player_data']
-            player = Player(self.game.hero, player_data['role_id'], CharWalk.DIR_DOWN,
-                            player_data['x'], player_data['y'],
-                            name=player_data['nickname'], uuid=player_data['uuid']
-                            )
-            self.game.other_player.append(player)
+                self.add_player(player_data)
+        elif protocol['protocol'] == 'ser_snapshot':
+            # 视野内移动了的玩家（服务端每隔一段时间发送一次）
+            server_time = protocol['time'] / 1000
+            self.clock.update(server_time)
+            for change in protocol['players']:
+                state = self.states.get(change['eid'])
+                player = self.game.other_player.get_eid(change['eid'])
+                if state is None or player is None:
+                    continue
+                state.update(change['state'])
+                player.push_position(server_time, state['x'], state['y'])
+        elif protocol['protocol'] == 'ser_move_path':
+            # 视野内的玩家开始寻路，按路径自己模拟行走，中途服务端不再逐格同步
+            server_time = protocol['time'] / 1000
+            self.clock.update(server_time)
+            state = self.states.get(protocol['eid'])
+            player = self.game.other_player.get_eid(protocol['eid'])
+            if state is None or player is None:
+                return
+            start = (protocol['sx'], protocol['sy'])
+            waypoints = [(p['x'], p['y']) for p in protocol['path']]
+            if waypoints:
+                state['x'], state['y'] = waypoints[-1]
+            player.follow_path(server_time, protocol['step_time'] / 1000, start, waypoints)
+        elif protocol['protocol'] in ('ser_online', 'ser_enter_view'):
+            # 有其他玩家上线，或者进入了视野
+            self.add_player(protocol['player_data'])
+        elif protocol['protocol'] in ('ser_offline', 'ser_leave_view'):
+            # 有其他玩家下线，或者离开了视野
+            self.remove_player(protocol['eid'])
+        elif protocol['protocol'] == 'ser_correct':
+            # 服务端纠正了自己的位置（比如客户端的路径和服务端不一致）
+            self.game.role.set_position(protocol['x'], protocol['y'])
         elif protocol['protocol'] == 'ser_chat':
             # 聊天
             self.game.chat_history.insert(0, "【%s】 " % protocol["nickname"] + protocol['text'])
             if len(self.game.chat_history) > 5:
                 self.game.chat_history.pop()
 
+    def add_player(self, player_data):
+        """
+        添加一个其他玩家
+        """
+        player = RemotePlayer(self.game.hero, player_data['role_id'], CharWalk.DIR_DOWN,
+                              player_data['x'], player_data['y'],
+                              name=player_data['nickname'], uuid=player_data['uuid'], eid=player_data['eid'],
+                              clock=self.clock)
+        self.game.other_player.add(player)
+        self.states[player.eid] = {'x': player_data['x'], 'y': player_data['y']}
+
+    def remove_player(self, eid):
+        """
+        删除一个其他玩家
+        """
+        player = self.game.other_player.get_eid(eid)
+        if player:
+            self.game.other_player.remove(player.uuid)
+        self.states.pop(eid, None)
+
     def login(self, username, password):
         """
         登录
@@ -116,18 +192,23 @@ class Client:
         data = {
             'protocol': 'cli_login',
             'username': username,
-            'password': password
+            'password': password,
+            'codec': BINARY  # 希望使用二进制格式
         }
         self.send(data)
 
-    def move(self, player):
+    def goto(self, start, end):
         """
-        玩家移动
+        玩家寻路（点击地图）
+        :param start: 寻路起点，服务端用来确认与客户端的位置一致
+        :param end: 寻路终点
         """
         data = {
-            'protocol': 'cli_move',
-            'x': player.next_mx,
-            'y': player.next_my
+            'protocol': 'cli_goto',
+            'sx': start[0],
+            'sy': start[1],
+            'x': end[0],
+            'y': end[1]
         }
         self.send(data)
 
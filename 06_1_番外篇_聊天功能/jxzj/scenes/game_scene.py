@@ -1,25 +1,35 @@
+import os
+
 import pygame
 
-from core import GameMap
+from core import ChunkedGameMap, GameMap, PlayerRegistry
+from engine.chunk import WORLD_FILE
 from engine.gui import TextBox
-from engine.scene import Scene
+from engine.scene import DirtyTracker, Scene
 from engine.sprite import Sprite, draw_src_outline_text
 from game_global import g
 
+CHUNKED_MAP = './img/map/0'  # 分块地图目录（python -m engine.chunk切分0.png生成），存在就使用分块地图
+
 
 class GameScene(Scene):
     def __init__(self, scene_id):
         super().__init__(scene_id=scene_id)
         self.hero = pygame.image.load('./img/character/hero.png').convert_alpha()
-        self.map_bottom = pygame.image.load('./img/map/0.png').convert_alpha()
-        self.map_top = pygame.image.load('./img/map/0_top.png').convert_alpha()
-        self.game_map = GameMap(self.map_bottom, self.map_top, 0, 0)
-        self.game_map.load_walk_file('./img/map/0.map')
+        if os.path.exists(os.path.join(CHUNKED_MAP, WORLD_FILE)):
+            self.game_map = ChunkedGameMap(CHUNKED_MAP, 0, 0)
+        else:
+            self.map_bottom = pygame.image.load('./img/map/0.png').convert_alpha()
+            self.map_top = pygame.image.load('./img/map/0_top.png').convert_alpha()
+            self.game_map = GameMap(self.map_bottom, self.map_top, 0, 0)
+            self.game_map.load_walk_file('./img/map/0.bmap')
         self.role = None
-        self.other_player = []
+        self.other_player = PlayerRegistry()  # 其他玩家
         self.chat_box = pygame.image.load('./img/chat_box.png').convert_alpha()
         self.chat_input = TextBox(145, 20, 75, 550, color=(0, 0, 0), no_bg=True, callback=self.cb_send_chat)
         self.chat_history = []
+        self.dirty = DirtyTracker()  # 脏矩形记录
+        self.last_view = None  # 上一帧的地图坐标，地图滚动了就需要整屏重绘
 
     def cb_send_chat(self, text):
         # 不予许发空字符串
@@ -32,9 +42,43 @@ class GameScene(Scene):
         self.role.logic()
         for player in self.other_player:
             player.logic()
-        self.game_map.roll(self.role.x, self.role.y)
 
-    def render(self):
+    def render(self, alpha=1):
+        # 在两次逻辑更新之间插值，地图跟着插值后的角色滚动
+        for player in [self.role, *self.other_player]:
+            player.interpolate(alpha)
+        self.game_map.roll(self.role.draw_x, self.role.draw_y)
+        view = (self.game_map.x, self.game_map.y)
+        # 地图自身的变化（分块地图刚加载完的块）
+        for rect in self.game_map.update(g.screen):
+            self.dirty.mark(rect)
+        # 记录各个对象的位置和状态
+        for player in [self.role, *self.other_player]:
+            self.dirty.track(player, player.rect(*view), player.draw_state())
+        self.dirty.track('chat', self.chat_rect(), tuple(self.chat_history))
+        self.dirty.track('chat_input', self.chat_input.rect(), self.chat_input.draw_state())
+        rects = self.dirty.collect()
+
+        # 地图滚动了，整屏重绘
+        if view != self.last_view:
+            self.last_view = view
+            self.draw()
+            return None
+
+        # 只重绘有变化的区域
+        for rect in rects:
+            g.screen.set_clip(rect)
+            self.draw()
+        g.screen.set_clip(None)
+        return rects
+
+    def chat_rect(self):
+        """
+        聊天记录绘制的范围
+        """
+        return pygame.Rect(0, 379, g.screen.get_width(), 25 * 4 + g.font.get_linesize() + 2)
+
+    def draw(self):
         self.game_map.draw_bottom(g.screen)
         self.role.draw(g.screen, self.game_map.x, self.game_map.y)
         # 绘制其他玩家
@@ -28,7 +28,7 @@ class LoginScene(Scene):
         界面逻辑
         """
 
-    def render(self):
+    def render(self, alpha=1):
         """
         渲染
         """
@@ -0,0 +1,99 @@
+from astar import AStar
+from engine.a_star import ConnectedComponents
+from engine.common import Array2D
+from engine.map_file import is_binary, open_walk_map
+from hpa import ClusterGraph
+
+
+class WalkMap(Array2D):
+    """
+    可行走区域（0可以走，其他为障碍）
+    不依赖pygame，客户端的GameMap和服务端共用，两边用同样的地图和寻路算法，算出来的路径也一样
+    """
+    HPA_MIN_CELLS = 10000  # 格子数达到这个数量的大地图才使用分层寻路
+
+    def __init__(self, w, h):
+        super().__init__(w, h)
+        self.hpa = None  # 分层寻路的抽象图，大地图才有
+        self.components = None  # 连通分量标记，用来快速判断终点能否走到
+
+    @classmethod
+    def open(cls, path):
+        """
+        打开二进制地图文件（.bmap），地图大小从文件头读取
+        """
+        w, h, _ = open_walk_map(path)
+        walk_map = cls(w, h)
+        walk_map.load_walk_file(path)
+        return walk_map
+
+    def load_walk_file(self, path, components=True):
+        """
+        读取可行走区域文件，支持.map文本格式和.bmap二进制格式
+        :param components: 是否计算连通分量，要扫描整张地图，分块地图不计算（分层寻路的簇用到时才构建，只读取用到的部分）
+        """
+        if is_binary(path):
+            w, h, data = open_walk_map(path)
+            if (w, h) != (self.w, self.h):
+                raise ValueError('地图文件大小(%d,%d)与地图(%d,%d)不一致' % (w, h, self.w, self.h))
+            self.attach(data)
+        else:
+            with open(path, 'rb') as file:
+                self.load_text(file.read())
+        # self.show_array2d()
+        if components:
+            self.components = ConnectedComponents(self, diagonal=False)
+        if self.w * self.h >= self.HPA_MIN_CELLS:
+            self.hpa = ClusterGraph(self)
+
+    def set_walk(self, x, y, v):
+        """
+        修改格子的可行走状态，同时更新寻路用的缓存
+        """
+        if self[x][y] == v:
+            return
+        self[x][y] = v
+        if self.components:
+            self.components.update(x, y)
+        if self.hpa:
+            self.hpa.update_cell(x, y)
+
+    def walkable(self, x, y):
+        return 0 <= x < self.w and 0 <= y < self.h and self[x][y] == 0
+
+    def find_path(self, start, end):
+        """
+        四方向寻路
+        :param start: 二元组类型的寻路起点
+        :param end: 二元组类型的寻路终点
+        :return: None或Point列表（路径，不包括起点）
+        """
+        if not self.walkable(*end):
+            return None
+        # 终点走不到，就不用寻路了（起点是障碍时，比如出生点，连通分量判断不了，直接寻路）
+        if self.components and self.walkable(*start) and not self.components.connected(start, end):
+            return None
+        if self.hpa:
+            return self.hpa.find_path(start, end)
+        return AStar(self, start, end).start()
+
+
+def compress_path(start, steps):
+    """
+    把逐格路径压缩成拐点列表（直线上的格子不需要发送）
+    :param start: 起点
+    :param steps: 逐格路径（二元组列表，不包括起点）
+    :return: 拐点列表，最后一个是终点
+    """
+    waypoints = []
+    prev = start
+    direction = None
+    for step in steps:
+        step_direction = (step[0] - prev[0], step[1] - prev[1])
+        if direction is not None and step_direction != direction:
+            waypoints.append(prev)
+        direction = step_direction
+        prev = step
+    if steps:
+        waypoints.append(prev)
+    return waypoints
@@ -0,0 +1,79 @@
+class AOIGrid:
+    """
+    视野管理（Area Of Interest）
+        1.把地图按cell_size*cell_size格划分成很多小格子（cell），记录每个cell中有哪些玩家
+        2.玩家能看到自己所在cell及周围一圈（3*3个cell）中的玩家，所以视野是相互的
+        3.玩家的移动、上线、下线只需要通知能看到他的玩家，而不是全服广播
+    """
+
+    def __init__(self, cell_size=16):
+        """
+        :param cell_size: cell的边长（地图格子数），不能小于客户端屏幕能显示的范围的一半
+        """
+        self.cell_size = cell_size
+        self.cells = {}  # cell -> {玩家}
+        self.positions = {}  # 玩家 -> cell
+
+    def cell_of(self, x, y):
+        return x // self.cell_size, y // self.cell_size
+
+    def around(self, cell):
+        """
+        cell及周围一圈cell中的所有玩家
+        """
+        cx, cy = cell
+        result = set()
+        for x in range(cx - 1, cx + 2):
+            for y in range(cy - 1, cy + 2):
+                entities = self.cells.get((x, y))
+                if entities:
+                    result |= entities
+        return result
+
+    def watchers(self, entity):
+        """
+        能看到该玩家的其他玩家
+        """
+        result = self.around(self.positions[entity])
+        result.discard(entity)
+        return result
+
+    def add(self, entity, x, y):
+        """
+        玩家进入地图
+        :return: 能看到该玩家的其他玩家
+        """
+        cell = self.cell_of(x, y)
+        self.positions[entity] = cell
+        self.cells.setdefault(cell, set()).add(entity)
+        return self.watchers(entity)
+
+    def remove(self, entity):
+        """
+        玩家离开地图
+        :return: 原来能看到该玩家的其他玩家
+        """
+        result = self.watchers(entity)
+        cell = self.positions.pop(entity)
+        self.cells[cell].discard(entity)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        return result
+
+    def move(self, entity, x, y):
+        """
+        玩家移动
+        :return: (新看到的玩家, 看不到了的玩家, 一直能看到的玩家)
+        """
+        old = self.positions[entity]
+        new = self.cell_of(x, y)
+        if old == new:
+            return set(), set(), self.watchers(entity)
+        before = self.watchers(entity)
+        self.cells[old].discard(entity)
+        if not self.cells[old]:
+            del self.cells[old]
+        self.positions[entity] = new
+        self.cells.setdefault(new, set()).add(entity)
+        after = self.watchers(entity)
+        return after - before, before - after, before & after
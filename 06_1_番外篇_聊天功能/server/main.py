@@ -1,15 +1,31 @@
 import datetime
-import json
+import itertools
+import os
+import selectors
 import socket
+import sys
 import time
 import traceback
 import uuid
-from threading import Thread
+from collections import deque
+
+# 与客户端共用的模块（不依赖pygame）
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'jxzj'))
+
+from aoi import AOIGrid  # noqa: E402
+from engine.codec import FrameDecoder, frame  # noqa: E402
+from engine.protocol import BINARY, JSON, decode, encode  # noqa: E402
+from walk_map import WalkMap, compress_path  # noqa: E402
+
+MAP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'jxzj', 'img', 'map', '0.bmap')
 
 
 class Server:
     """
     服务端主类
+        所有连接都由一个selectors事件循环处理（非阻塞socket），不再为每个连接创建线程
+        事件循环每秒固定执行tick_rate次用户自定义类的tick()，用于处理游戏逻辑
+        发送的数据每隔flush_interval秒才合并发送一次（空闲时立即发送），负载高时一次系统调用可以发送更多数据
     """
     __user_cls = None
 
@@ -30,25 +46,84 @@ class Server:
             s = "[" + str(cur_time) + "]" + msg
             file.write(s)
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, tick_rate=20, flush_interval=0.005):
+        """
+        :param tick_rate: 每秒执行tick的次数
+        :param flush_interval: 合并发送的最小间隔（秒），0表示每轮事件循环都发送
+        """
         self.connections = []  # 所有客户端连接
+        self.tick_interval = 1 / tick_rate
+        self.flush_interval = flush_interval
+        self.selector = selectors.DefaultSelector()  # 事件循环
         self.write_log('服务器启动中，请稍候...')
         try:
             self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # 监听者，用于接收新的socket连接
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.listener.bind((ip, port))  # 绑定ip、端口
-            self.listener.listen(5)  # 最大等待数
+            self.listener.listen(1024)  # 最大等待数
+            self.listener.setblocking(False)
         except:
             self.write_log('服务器启动失败，请检查ip端口是否被占用。详细原因请查看日志文件')
             self.write_in_log_file(traceback.format_exc())
+            return
 
         if self.__user_cls is None:
             self.write_log('服务器启动失败，未注册用户自定义类')
             return
 
+        self.selector.register(self.listener, selectors.EVENT_READ, self.accept)
         self.write_log('服务器启动成功：{}:{}'.format(ip, port))
+        self.run()
+
+    def run(self):
+        """
+        事件循环
+        """
+        next_tick = next_flush = time.perf_counter()
+        while True:
+            # 最多等到下一个tick（有数据等待发送的话最多等到下次发送）
+            timeout = next_tick
+            if Connection.unflushed:
+                timeout = min(timeout, next_flush)
+            timeout = max(0, timeout - time.perf_counter())
+            events = self.selector.select(timeout)
+            # 一次有多个事件（负载高）时，这批事件中写入的数据合并发送；只有一个事件时立即发送，空闲时延迟最低
+            Connection.batching = len(events) > 1
+            for key, mask in events:
+                callback = key.data
+                callback(key.fileobj, mask)
+            now = time.perf_counter()
+            if now >= next_tick:
+                # tick中写入的数据也合并发送
+                Connection.batching = True
+                self.__user_cls.tick(self.connections)
+                next_tick += self.tick_interval
+                # 处理不过来了，不补执行落下的tick
+                if next_tick < now:
+                    next_tick = now + self.tick_interval
+            Connection.batching = False
+            # 把这段时间写入的数据统一发送
+            if Connection.unflushed and now >= next_flush:
+                Connection.flush_all()
+                next_flush = now + self.flush_interval
+
+    def accept(self, listener, mask):
+        """
+        有新连接进入（一次把等待中的连接都接收完）
+        """
         while True:
-            client, _ = self.listener.accept()  # 阻塞，等待客户端连接
-            user = self.__user_cls(client, self.connections)
+            try:
+                client, _ = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # 比如文件描述符用完了，先不接收，等下次事件
+                self.write_in_log_file(traceback.format_exc())
+                return
+            client.setblocking(False)
+            # 数据已经在flush_all中合并过了，不需要Nagle算法再等待合并，关掉可以降低延迟
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            user = self.__user_cls(client, self.connections, self.selector)
             self.connections.append(user)
             self.write_log('有新连接进入，当前连接数：{}'.format(len(self.connections)))
 
@@ -67,39 +142,172 @@ class Server:
 class Connection:
     """
     连接类，每个socket连接都是一个connection
+        write()时发送队列是空的（连接空闲）就立即发送，延迟最低
+        tick中、或者一次处理多个事件时（负载高），write()只把数据放入发送队列，由事件循环统一发送（flush_all），
+        这期间发给同一个连接的多个包合并成一次系统调用
+        发送队列有上限：
+            1.待发送的数据超过HIGH_WATERMARK就标记为拥堵（congested），降到LOW_WATERMARK以下才恢复，拥堵时可以少发不重要的数据
+            2.拥堵超过SLOW_TIMEOUT秒，或者待发送的数据超过MAX_QUEUE，说明客户端太慢（或者卡死了），直接断开
     """
-
-    def __init__(self, socket, connections):
+    HIGH_WATERMARK = 256 * 1024
+    LOW_WATERMARK = 64 * 1024
+    MAX_QUEUE = 4 * 1024 * 1024
+    SLOW_TIMEOUT = 10
+    IOV_MAX = 1024  # 一次sendmsg最多发送的数据块数
+    DEFER_FLUSH = True  # 为False时每次write都立即发送（用于对比测试）
+    unflushed = set()  # 发送队列中有数据、等待统一发送的连接
+    batching = False  # 正在执行tick或者处理一批事件，这期间写入的数据合并发送
+
+    def __init__(self, socket, connections, selector):
         self.socket = socket
         self.connections = connections
+        self.selector = selector
+        self.send_queue = deque()  # 还没发送出去的数据
+        self.queued_bytes = 0  # 发送队列中的字节数
+        self.congested_since = None  # 从什么时候开始拥堵的，None表示没有拥堵
+        self.waiting_writable = False  # socket缓冲区满了，正在等待可写事件
+        self.closed = False
         self.data_handler()
 
+    @property
+    def congested(self):
+        return self.congested_since is not None
+
     def data_handler(self):
-        # 给每个连接创建一个独立的线程进行管理
-        thread = Thread(target=self.recv_data)
-        thread.setDaemon(True)
-        thread.start()
+        # 把连接注册到事件循环中，有数据可读（或可写）时调用on_event
+        self.selector.register(self.socket, selectors.EVENT_READ, self.on_event)
+
+    def on_event(self, sock, mask):
+        if mask & selectors.EVENT_READ:
+            self.recv_data()
+        if mask & selectors.EVENT_WRITE and not self.closed:
+            self.flush()
 
     def recv_data(self):
         # 接收数据
         bytes = None
         try:
-            while True:
-                bytes = self.socket.recv(4096)  # 我们这里只做一个简单的服务端框架，只做粘包不做分包处理。
-                if len(bytes) == 0:
-                    Server.write_log('有玩家离线啦：' + str(self.game_data))
-                    self.socket.close()
-                    # 删除连接
-                    self.connections.remove(self)
-                    break
-                # 处理数据
-                self.deal_data(bytes)
+            bytes = self.socket.recv(65536)
+            if len(bytes) == 0:
+                Server.write_log('有玩家离线啦：' + str(getattr(self, 'game_data', None)))
+                self.close()
+                return
+            # 处理数据
+            self.deal_data(bytes)
+        except (BlockingIOError, InterruptedError):
+            return
         except:
-            self.socket.close()
-            self.connections.remove(self)
-            Server.write_log('有用户发送的数据异常：' + bytes.decode() + '\n' + '已强制下线，详细原因请查看日志文件')
+            self.close()
+            Server.write_log('有用户发送的数据异常：' + repr(bytes) + '\n' + '已强制下线，详细原因请查看日志文件')
             Server.write_in_log_file(traceback.format_exc())
 
+    def write(self, data):
+        """
+        发送数据：先放到发送队列，连接空闲时立即发送，否则由事件循环统一发送（socket缓冲区满了就等可写时再发）
+        广播时多个连接共用同一份数据，不复制
+        """
+        if self.closed:
+            return
+        idle = not self.send_queue
+        self.send_queue.append(data)
+        self.queued_bytes += len(data)
+        if not self.waiting_writable:
+            # 已经有数据在等待统一发送的话，跟它们合并
+            if self.DEFER_FLUSH and (Connection.batching or not idle):
+                Connection.unflushed.add(self)
+            else:
+                self.flush()
+        self.check_congestion()
+
+    @staticmethod
+    def flush_all():
+        """
+        发送所有连接在发送队列中等待的数据
+        """
+        connections = Connection.unflushed
+        Connection.unflushed = set()
+        for conn in connections:
+            if not conn.closed and not conn.waiting_writable:
+                conn.flush()
+
+    def check_congestion(self):
+        """
+        根据发送队列的大小更新拥堵状态，太慢的客户端直接断开
+        """
+        if self.queued_bytes > self.HIGH_WATERMARK:
+            if self.congested_since is None:
+                self.congested_since = time.perf_counter()
+            # 每次写入都要检查MAX_QUEUE，不能等到下次写入
+            if time.perf_counter() - self.congested_since > self.SLOW_TIMEOUT or self.queued_bytes > self.MAX_QUEUE:
+                Server.write_log('客户端接收太慢，已强制下线：' + str(getattr(self, 'game_data', None)))
+                self.close()
+        elif self.queued_bytes <= self.LOW_WATERMARK:
+            self.congested_since = None
+
+    def flush(self):
+        """
+        socket可写了，把发送队列中的数据发出去（多块数据合并成一次系统调用）
+        """
+        while self.send_queue:
+            buffers = list(itertools.islice(self.send_queue, self.IOV_MAX))
+            try:
+                if hasattr(self.socket, 'sendmsg'):
+                    sent = self.socket.sendmsg(buffers)
+                else:
+                    # Windows没有sendmsg
+                    sent = self.socket.send(b''.join(buffers))
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.close()
+                return
+            self.queued_bytes -= sent
+            # 删除已经发送的数据块
+            while sent:
+                data = self.send_queue[0]
+                if sent < len(data):
+                    self.send_queue[0] = memoryview(data)[sent:]
+                    break
+                sent -= len(data)
+                self.send_queue.popleft()
+            if self.send_queue and len(buffers) < self.IOV_MAX:
+                # 没有全部发送出去，说明socket缓冲区满了
+                break
+        self.check_congestion()
+        if self.closed:
+            return
+        # 没发完就等可写时再发
+        waiting = bool(self.send_queue)
+        if waiting != self.waiting_writable:
+            self.waiting_writable = waiting
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE if waiting else selectors.EVENT_READ
+            self.selector.modify(self.socket, events, self.on_event)
+
+    def close(self):
+        """
+        关闭连接
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.selector.unregister(self.socket)
+        self.socket.close()
+        # 删除连接
+        self.connections.remove(self)
+        self.on_close()
+
+    def on_close(self):
+        """
+        连接关闭后调用，子类可以重写
+        """
+
+    @classmethod
+    def tick(cls, connections):
+        """
+        服务端每个tick调用一次，子类可以重写
+        :param connections: 所有客户端连接
+        """
+
     def deal_data(self, bytes):
         """
         处理客户端的数据，需要子类实现
@@ -109,69 +317,374 @@ class Connection:
 
 @Server.register_cls
 class Player(Connection):
+    aoi = AOIGrid()  # 所有玩家共用的视野管理
+    REPLICATED = ('x', 'y')  # 需要增量同步给视野内玩家的字段
+    walk_map = WalkMap.open(MAP_FILE)  # 可行走区域，与客户端使用同一个文件
+    STEP_TIME = 32 / 2 / 60  # 走一格的时间，与客户端一致（每次逻辑更新2像素，每秒60次）
+    STEP_TOLERANCE = 0.05  # 网络抖动时允许提前的时间
+    MAX_INPUTS = 32  # 最多排队多少个cli_move，超过的丢弃
+    SNAPSHOT_INTERVAL = 0.1  # 发送快照的间隔，客户端会在快照之间插值，不需要每个tick都发送
+    START_TIME = time.perf_counter()  # 同步协议中的服务端时间从这里开始计算
+    moved_players = {}  # 上次发送快照后移动过的玩家（当作有序的集合使用）
+    lagging_watchers = {}  # 因为拥堵有快照没发送的客户端（当作有序的集合使用）
+    next_snapshot = 0  # 下次发送快照的时间
+    free_eids = []  # 回收的实体编号
+    next_eid = 1  # 下一个新的实体编号
 
     def __init__(self, *args):
         self.login_state = False  # 登录状态
         self.game_data = None  # 玩家游戏中的相关数据
         self.protocol_handler = ProtocolHandler()  # 协议处理对象
+        self.decoder = FrameDecoder()  # 分帧解码器，根据客户端发来的第一个字节判断是否是旧的"|#|"分隔格式
+        self.codec = JSON  # 发送给客户端的包使用的编码，登录时协商
+        self.inputs = deque()  # 接下来要走的格子，tick中按行走速度逐格处理
+        self.next_step = 0  # 最早什么时候可以走下一格
+        self.eid = None  # 实体编号，登录后分配，比uuid短得多，用于同步协议
+        self.baselines = {}  # 已经发送给这个客户端的其他玩家的状态 eid -> {字段: 值}
+        self.pending_players = {}  # 拥堵时没有发送快照的玩家，恢复后一起发送（当作有序的集合使用）
+        self.walking_path = False  # 是否正在按寻路的路径行走（这时视野内的客户端自己模拟行走）
+        self.path_followers = set()  # 收到了当前路径的客户端，不需要再逐格同步
         super().__init__(*args)
 
     def deal_data(self, bytes):
         """
         我们规定协议类型：
-            1.每个数据包都以json字符串格式传输
+            1.每个数据包都以json字符串格式传输（也可以协商使用二进制格式，见第4条）
             2.json中必须要有protocol字段，该字段表示协议名称
-            3.因为会出现粘包现象，所以我们使用特殊字符串"|#|"进行数据包切割。这样的话，一定要注意数据包内不允许出现该字符。
+            3.因为会出现粘包、分包现象，每个数据包前面加上4字节的包体长度（大端），见engine.codec。
+              兼容旧客户端：如果客户端发来的数据以"{"开头，就使用特殊字符串"|#|"进行数据包切割，回复的数据包也使用这个格式。
+              下面的例子为了方便阅读，都写成了"|#|"格式。
+            4.登录时可以协商使用二进制格式（见engine.protocol），登录成功后常用协议都按二进制编码，包体第一个字节不是"{"。
         例如我们需要的协议：
             登录协议：
-                客服端发送：{"protocol":"cli_login","username":"玩家账号","password":"玩家密码"}|#|
+                客服端发送：{"protocol":"cli_login","username":"玩家账号","password":"玩家密码","codec":"binary"}|#|
                 服务端返回：
-                    登录成功：
-                        {"protocol":"ser_login","result":true,"player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|
+                    登录成功（codec是之后使用的编码，旧格式的连接只能使用json）：
+                        {"protocol":"ser_login","result":true,"codec":"binary","player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|
                     登录失败：
                         {"protocol":"ser_login","result":false,"msg":"账号或密码错误"}|#|
             当前所有在线玩家：
                 服务端发送：{"protocol":"ser_player_list","player_list":[{"nickname":"昵称","x":5,"y":5}]}|#|
             玩家移动协议：
-                客户端发送：{"protocol":"cli_move","x":100,"y":100}|#|
-                服务端发送给所有客户端：{"protocol":"ser_move","player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|
+                客户端发送（走一格）：{"protocol":"cli_move","x":100,"y":100}|#|
+                客户端发送（寻路，只发送起点和终点，服务端用同样的地图和寻路算法计算路径）：
+                    {"protocol":"cli_goto","sx":5,"sy":5,"x":100,"y":100}|#|
+                服务端把路径发送给视野内的其他玩家（只包含拐点和终点），客户端自己逐格模拟行走，中途不再同步：
+                    {"protocol":"ser_move_path","time":1000,"step_time":267,"eid":1,"sx":5,"sy":5,"path":[{"x":5,"y":9},{"x":8,"y":9}]}|#|
+                服务端按客户端的行走速度逐格移动玩家，不能走的格子或者起点对不上时纠正客户端的位置：
+                    {"protocol":"ser_correct","x":5,"y":5}|#|
+                服务端每隔一段时间给每个客户端发送一次视野内所有移动了的玩家（不包括按ser_move_path行走的），只包含和上次发送给这个客户端时相比变化了的字段：
+                    {"protocol":"ser_snapshot","time":1000,"players":[{"eid":1,"state":{"x":5}}]}|#|
+                time是服务端时间（毫秒），step_time是走一格的时间（毫秒），客户端据此在收到的位置之间插值
+                （旧格式的客户端不认识ser_snapshot，改为逐个发送：{"protocol":"ser_move","player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|）
             玩家上线协议：
                 服务端发送给所有客户端：{"protocol":"ser_online","player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|
             玩家下线协议：
-                服务端发送给所有客户端：{"protocol":"ser_offline","player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|
-        """
-        # 将字节流转成字符串
-        pck = bytes.decode()
-        # 切割数据包
-        pck = pck.split('|#|')
-        # 处理每一个协议,最后一个是空字符串，不用处理它
-        for str_protocol in pck[:-1]:
-            protocol = json.loads(str_protocol)
+                服务端发送给所有客户端：{"protocol":"ser_offline","eid":1}|#|
+            玩家进入视野：
+                服务端发送：{"protocol":"ser_enter_view","player_data":{"uuid":"07103feb0bb041d4b14f4f61379fbbfa","nickname":"昵称","x":5,"y":5}}|#|
+            玩家离开视野：
+                服务端发送：{"protocol":"ser_leave_view","eid":1}|#|
+        移动、上线、下线协议只发送给视野内的玩家（见AOIGrid）
+        player_data中的eid是玩家的实体编号（登录时分配的小整数，下线后会被重复使用），同步协议中用它代替uuid
+        """
+        self.decoder.feed(bytes)
+        # 处理每一个完整的数据包，不完整的留在缓冲区中等待后面的数据
+        for pck in self.decoder:
+            protocol = decode(pck)
             # 根据协议中的protocol字段，直接调用相应的函数处理
             self.protocol_handler(self, protocol)
 
+    @staticmethod
+    def pack(py_obj, delimiter=False, codec=JSON):
+        """
+        把协议包编码成要发送的字节
+        :param delimiter: 是否使用旧的"|#|"分隔格式
+        :param codec: JSON或BINARY
+        """
+        return frame(encode(py_obj, codec), delimiter)
+
     def send(self, py_obj):
         """
         给玩家发送协议包
         py_obj:python的字典或者list
         """
-        self.socket.sendall((json.dumps(py_obj, ensure_ascii=False) + '|#|').encode())
+        self.write(self.pack(py_obj, self.decoder.delimiter, self.codec))
+
+    def broadcast(self, py_obj, players, exclude=None):
+        """
+        把同一个协议包发送给多个玩家，只编码一次
+        :param players: 接收者
+        :param exclude: 不发送给这个玩家
+        """
+        if not players:
+            return
+        packed = {}  # 每种格式只编码一次
+        for player in list(players):  # 发送失败会关闭连接并从列表中删除，所以遍历副本
+            if player is not exclude and player.login_state:
+                key = (bool(player.decoder.delimiter), player.codec)
+                if key not in packed:
+                    packed[key] = self.pack(py_obj, *key)
+                player.write(packed[key])
 
     def send_all_player(self, py_obj):
         """
         把这个数据包发送给所有在线玩家，包括自己
         """
-        for player in self.connections:
-            if player.login_state:
-                player.send(py_obj)
+        self.broadcast(py_obj, self.connections)
 
     def send_without_self(self, py_obj):
         """
         发送给除了自己的所有在线玩家
         """
-        for player in self.connections:
-            if player is not self and player.login_state:
-                player.send(py_obj)
+        self.broadcast(py_obj, self.connections, self)
+
+    def send_watchers(self, py_obj, watchers=None):
+        """
+        发送给视野内的其他玩家
+        """
+        self.broadcast(py_obj, self.aoi.watchers(self) if watchers is None else watchers)
+
+    def can_step(self, x, y):
+        """
+        能否从当前位置走到(x,y)：只能走到上下左右相邻的可行走格子
+        """
+        if not self.is_tile(x, y):
+            return False
+        dx = abs(x - self.game_data['x'])
+        dy = abs(y - self.game_data['y'])
+        return dx + dy == 1 and self.walk_map.walkable(x, y)
+
+    def correct(self):
+        """
+        停止行走，让客户端回到服务端记录的位置
+        """
+        self.inputs.clear()
+        self.stop_path()
+        self.send({"protocol": "ser_correct", "x": self.game_data['x'], "y": self.game_data['y']})
+
+    def goto(self, start, end):
+        """
+        寻路，客户端寻路时的起点可能是服务端还没走到的格子（客户端先走），这一段保留
+        起点、终点不合法（不是地图内的格子）时纠正客户端的位置
+        """
+        if not (self.is_tile(*start) and self.is_tile(*end)):
+            self.correct()
+            return
+        position = (self.game_data['x'], self.game_data['y'])
+        steps = list(self.inputs)
+        if start == position:
+            steps = []
+        elif start in steps:
+            steps = steps[:steps.index(start) + 1]
+        else:
+            self.correct()
+            return
+        path = self.walk_map.find_path(start, end)
+        if path:
+            steps += [(p.x, p.y) for p in path]
+        self.inputs = deque(steps)
+        # 路径只需要发送一次，视野内的客户端自己逐格行走
+        self.stop_path()
+        self.walking_path = bool(steps)
+        self.send_path(self.aoi.watchers(self))
+
+    def send_path(self, watchers):
+        """
+        把剩下的路径发送给这些玩家（旧格式的客户端不支持，仍然逐格同步）
+        发送后以终点作为增量同步的基准，到达终点时位置和基准一样，不会再发送快照
+        """
+        watchers = [p for p in watchers if p.login_state and not p.decoder.delimiter and self.eid in p.baselines]
+        if not self.walking_path or not self.inputs or not watchers:
+            return
+        start = (self.game_data['x'], self.game_data['y'])
+        waypoints = compress_path(start, self.inputs)
+        self.broadcast({"protocol": "ser_move_path", "time": self.server_time(),
+                        "step_time": round(self.STEP_TIME * 1000), "eid": self.eid, "sx": start[0], "sy": start[1],
+                        "path": [{"x": x, "y": y} for x, y in waypoints]}, watchers)
+        x, y = waypoints[-1]
+        for p in watchers:
+            p.baselines[self.eid].update(x=x, y=y)
+            self.path_followers.add(p)
+
+    def stop_path(self):
+        """
+        不再按路径行走（走完了或者被纠正），之后的移动恢复逐格同步
+        """
+        self.walking_path = False
+        self.path_followers.clear()
+
+    def move_to(self, x, y):
+        """
+        移动到(x,y)，进入、离开了谁的视野，双方都要通知
+        """
+        self.game_data['x'] = x
+        self.game_data['y'] = y
+        entered, left, _ = self.aoi.move(self, x, y)
+        self.send_watchers({"protocol": "ser_enter_view", "player_data": self.game_data}, entered)
+        self.send_watchers({"protocol": "ser_leave_view", "eid": self.eid}, left)
+        for p in entered:
+            p.see(self)
+            self.send({"protocol": "ser_enter_view", "player_data": p.game_data})
+            self.see(p)
+            # 正在按路径行走的话，刚看到的玩家也需要知道剩下的路径
+            self.send_path([p])
+            p.send_path([self])
+        for p in left:
+            p.unsee(self)
+            self.send({"protocol": "ser_leave_view", "eid": p.eid})
+            self.unsee(p)
+            self.path_followers.discard(p)
+            p.path_followers.discard(self)
+
+    def see(self, player):
+        """
+        已经把player的完整数据发给了客户端，以此作为之后增量同步的基准
+        """
+        self.baselines[player.eid] = {key: player.game_data[key] for key in self.REPLICATED}
+
+    def unsee(self, player):
+        """
+        player离开了视野，不再同步
+        """
+        self.baselines.pop(player.eid, None)
+
+    def send_snapshot(self, players, server_time):
+        """
+        把这些玩家的最新状态打包成一个协议发送给自己，只发送和上次发送时相比变化了的字段
+        TCP保证按顺序送达，所以上次发送的状态就是客户端当前的状态，不需要客户端确认
+        :param server_time: 快照的服务端时间（毫秒）
+        """
+        if self.decoder.delimiter:
+            # 旧格式的客户端不认识ser_snapshot
+            for p in players:
+                self.send({"protocol": "ser_move", "player_data": p.game_data})
+            return
+        changes = []
+        for p in players:
+            if self in p.path_followers:
+                # 客户端正在按ser_move_path模拟行走
+                continue
+            baseline = self.baselines.get(p.eid)
+            if baseline is None:
+                continue
+            state = {key: p.game_data[key] for key in self.REPLICATED if p.game_data[key] != baseline[key]}
+            if state:
+                baseline.update(state)
+                changes.append({"eid": p.eid, "state": state})
+        if changes:
+            self.send({"protocol": "ser_snapshot", "time": server_time, "players": changes})
+
+    @classmethod
+    def is_tile(cls, x, y):
+        """
+        是不是地图内的格子坐标（客户端发来的数据不可信，可能是小数、null等）
+        """
+        return type(x) is int and type(y) is int and 0 <= x < cls.walk_map.w and 0 <= y < cls.walk_map.h
+
+    def walk(self, now):
+        """
+        按行走速度走完到now为止应该走的格子
+        """
+        while self.inputs and self.login_state and now >= self.next_step:
+            x, y = self.inputs.popleft()
+            if not self.can_step(x, y):
+                self.correct()
+                break
+            self.move_to(x, y)
+            self.next_step = max(self.next_step, now - self.STEP_TOLERANCE) + self.STEP_TIME
+        if not self.inputs:
+            self.stop_path()
+
+    def kick(self, msg):
+        """
+        tick中处理这个玩家时出错了，只断开这个玩家，不能影响整个服务端
+        """
+        self.close()
+        Server.write_log(msg + str(self.game_data))
+        Server.write_in_log_file(traceback.format_exc())
+
+    @classmethod
+    def tick(cls, connections):
+        # 所有玩家按行走速度走格子
+        now = time.perf_counter()
+        for player in connections[:]:
+            if not player.inputs or now < player.next_step:
+                continue
+            try:
+                player.walk(now)
+            except:
+                player.kick('处理玩家移动时出错，已强制下线：')
+                continue
+            cls.moved_players[player] = None
+
+        if now < cls.next_snapshot:
+            return
+        cls.next_snapshot = max(cls.next_snapshot + cls.SNAPSHOT_INTERVAL, now)
+        moved, cls.moved_players = cls.moved_players, {}
+        server_time = cls.server_time(now)
+
+        # 每个客户端只发送一个快照，包含视野内所有移动了的玩家
+        snapshots = {}
+        for player in moved:
+            if player.login_state:
+                for watcher in player.aoi.watchers(player):
+                    snapshots.setdefault(watcher, []).append(player)
+        # 之前拥堵的客户端，就算这次没有玩家移动，也要看看能不能补发
+        for watcher in cls.lagging_watchers:
+            snapshots.setdefault(watcher, [])
+        cls.lagging_watchers = {}
+        for watcher, players in snapshots.items():
+            if watcher.closed:
+                continue
+            if watcher.congested:
+                # 拥堵的客户端这次先不发，记下这些玩家，恢复后把他们的变化一起发过去
+                watcher.pending_players.update(dict.fromkeys(players))
+                cls.lagging_watchers[watcher] = None
+                continue
+            if watcher.pending_players:
+                pending, watcher.pending_players = watcher.pending_players, {}
+                pending.update(dict.fromkeys(players))
+                # 这期间下线了的玩家不发（编号可能已经给了别人）
+                players = [p for p in pending if p.login_state]
+            try:
+                watcher.send_snapshot(players, server_time)
+            except:
+                watcher.kick('发送快照时出错，已强制下线：')
+
+    def on_close(self):
+        if not self.login_state:
+            return
+        self.login_state = False
+        # 通知视野内的玩家自己下线了
+        watchers = self.aoi.remove(self)
+        self.send_watchers({"protocol": "ser_offline", "eid": self.eid}, watchers)
+        for p in watchers:
+            p.unsee(self)
+            p.path_followers.discard(self)
+        self.stop_path()
+        # 其他客户端都已经删除了这个编号，可以回收了
+        self.free_eids.append(self.eid)
+
+    @classmethod
+    def server_time(cls, now=None):
+        """
+        同步协议中的服务端时间（毫秒）
+        """
+        if now is None:
+            now = time.perf_counter()
+        return int((now - cls.START_TIME) * 1000)
+
+    @classmethod
+    def alloc_eid(cls):
+        """
+        分配一个实体编号
+        """
+        if cls.free_eids:
+            return cls.free_eids.pop()
+        eid = cls.next_eid
+        cls.next_eid += 1
+        return eid
 
 
 class ProtocolHandler:
@@ -199,6 +712,9 @@ class ProtocolHandler:
             ['admin02', '123456', '玩家昵称2', 48],
             ['admin03', '123456', '玩家昵称3', 6],
         ]
+        # 已经登录了
+        if player.login_state:
+            return
         username = protocol.get('username')
         password = protocol.get('password')
 
@@ -220,7 +736,12 @@ class ProtocolHandler:
 
         # 登录成功
         player.login_state = True
+        # 客户端支持的话使用二进制格式（旧的"|#|"分隔格式不能传输二进制数据）
+        if protocol.get('codec') == BINARY and not player.decoder.delimiter:
+            player.codec = BINARY
+        player.eid = player.alloc_eid()
         player.game_data = {
+            'eid': player.eid,
             'uuid': uuid.uuid4().hex,
             'nickname': nickname,
             'x': 5,  # 初始位置
@@ -229,17 +750,19 @@ class ProtocolHandler:
         }
 
         # 发送登录成功协议
-        player.send({"protocol": "ser_login", "result": True, "player_data": player.game_data})
+        player.send({"protocol": "ser_login", "result": True, "codec": player.codec, "player_data": player.game_data})
 
-        # 发送上线信息给其他玩家
-        player.send_without_self({"protocol": "ser_online", "player_data": player.game_data})
+        # 发送上线信息给视野内的其他玩家
+        watchers = player.aoi.add(player, player.game_data['x'], player.game_data['y'])
+        player.send_watchers({"protocol": "ser_online", "player_data": player.game_data}, watchers)
+        for p in watchers:
+            p.see(player)
 
-        player_list = []
-        for p in player.connections:
-            if p is not player and p.login_state:
-                player_list.append(p.game_data)
-        # 发送当前在线玩家列表给自己（player_list不包括自己）
+        # 发送视野内的玩家列表给自己（player_list不包括自己）
+        player_list = [p.game_data for p in watchers]
         player.send({"protocol": "ser_player_list", "player_list": player_list})
+        for p in watchers:
+            player.see(p)
 
     @staticmethod
     def cli_move(player, protocol):
@@ -250,12 +773,22 @@ class ProtocolHandler:
         if not player.login_state:
             return
 
-        # 客户端想要去的位置
-        player.game_data['x'] = protocol.get('x')
-        player.game_data['y'] = protocol.get('y')
+        x = protocol.get('x')
+        y = protocol.get('y')
+        if not player.is_tile(x, y) or len(player.inputs) >= player.MAX_INPUTS:
+            return
+        # 客户端想要去的位置，tick中检查能不能走（逐格移动时恢复逐格同步）
+        player.stop_path()
+        player.inputs.append((x, y))
 
-        # 告诉其他玩家当前玩家的位置变化了
-        player.send_without_self({"protocol": "ser_move", "player_data": player.game_data})
+    @staticmethod
+    def cli_goto(player, protocol):
+        """
+        客户端寻路请求
+        """
+        if not player.login_state:
+            return
+        player.goto((protocol.get('sx'), protocol.get('sy')), (protocol.get('x'), protocol.get('y')))
 
     @staticmethod
     def cli_chat(player, protocol):